@@ -0,0 +1,92 @@
+"""测量图形客户端停留在各页面时的 CPU 占用 (需要图形界面环境)
+
+启动一个本地服务端, 在同一进程内运行客户端, 依次切换到每个页面,
+预热后统计进程 CPU 时间占墙钟时间的比例, 以 JSON 输出.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLATFORM = {'win32': 'windows', 'darwin': 'macos'}.get(sys.platform, 'linux')
+
+def load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="测量客户端各页面的空闲 CPU 占用")
+    parser.add_argument('--client', default=os.path.join(ROOT, 'client', f'client-{PLATFORM}.py'))
+    parser.add_argument('--server', default=os.path.join(ROOT, 'server', f'server-{PLATFORM}.py'))
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--warmup', type=float, default=3, help="切换页面后等待的秒数")
+    parser.add_argument('--seconds', type=float, default=10, help="每个页面的测量时长")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    server = subprocess.Popen(
+        [sys.executable, args.server, '--host', '127.0.0.1', '--port', str(args.port)],
+        stdout=subprocess.DEVNULL
+    )
+    config_dir = tempfile.mkdtemp()
+    config_file = os.path.join(config_dir, 'bench.ipcfg')
+    with open(config_file, 'w') as f:
+        f.write(f"[SERVER]\nhost = 127.0.0.1\nport = {args.port}\n")
+
+    try:
+        time.sleep(1)
+        # 客户端从所在目录导入 monitor_stream
+        sys.path.insert(0, os.path.dirname(os.path.abspath(args.client)))
+        client = load_module(args.client, 'client_app')
+        client.ServerMonitorApp.CONFIG_FILE = config_file
+        root = client.tk.Tk()
+        app = client.ServerMonitorApp(root)
+        pages = ['cpu', 'memory', 'network', 'disk', 'processes', 'settings']
+        results = {}
+
+        def measure(index):
+            page = pages[index]
+            app.show_page(page)
+
+            def start():
+                cpu_start = time.process_time()
+                wall_start = time.perf_counter()
+
+                def finish():
+                    cpu = time.process_time() - cpu_start
+                    wall = time.perf_counter() - wall_start
+                    results[page] = {
+                        'cpu_seconds': round(cpu, 4),
+                        'wall_seconds': round(wall, 4),
+                        'cpu_percent': round(cpu / wall * 100, 2)
+                    }
+                    if index + 1 < len(pages):
+                        measure(index + 1)
+                    else:
+                        app.on_close()
+
+                root.after(int(args.seconds * 1000), finish)
+
+            root.after(int(args.warmup * 1000), start)
+
+        root.after(0, measure, 0)
+        root.mainloop()
+        print(json.dumps({
+            'client': os.path.basename(args.client),
+            'refresh_interval_ms': app.refresh_interval(),
+            'pages': results
+        }, indent=2))
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""比较 Linux 服务端两种采集方式的单次耗时 (仅限 Linux)
+
+- psutil: get_system_stats, 每次经 psutil 打开并解析 /proc 下的文件
+- proc: ProcCollector, 文件保持打开, 用 os.preadv 读入复用的缓冲区
+分别测量全部分组 (含每核心占用率) 和加上按网卡统计时的耗时, 以 JSON 输出.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="比较 /proc 快速采集与 psutil 的单次耗时")
+    parser.add_argument('--server', default=os.path.join(ROOT, 'server', 'server-linux.py'))
+    parser.add_argument('--samples', type=int, default=5000, help="每种方式采集的次数")
+    return parser.parse_args()
+
+def measure(collect, groups, samples):
+    collect(groups, True)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        collect(groups, True)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        'mean_us': round(statistics.mean(timings), 2),
+        'p50_us': round(timings[len(timings) // 2], 2),
+        'p99_us': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 2)
+    }
+
+def main():
+    args = parse_args()
+    server = load_module(args.server, 'server_app')
+    proc = server.ProcCollector()
+    cases = {
+        'all': server.STATS_GROUPS,
+        'all+interfaces': server.STATS_GROUPS | {'interfaces'}
+    }
+    results = {'cores': os.cpu_count(), 'samples': args.samples, 'cases': {}}
+    try:
+        for name, groups in cases.items():
+            psutil_path = measure(server.get_system_stats, groups, args.samples)
+            proc_path = measure(proc.collect, groups, args.samples)
+            results['cases'][name] = {
+                'psutil': psutil_path,
+                'proc': proc_path,
+                'speedup': round(psutil_path['mean_us'] / proc_path['mean_us'], 2)
+            }
+    finally:
+        proc.close()
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""服务端负载测试: 模拟大量客户端同时订阅, 观察采样抖动和延迟随客户端数量的变化
+
+每一档客户端数启动一个新的本地服务端, 由若干工作进程各自在一个事件循环中运行一批轻量客户端
+(只解析数据流, 不记录历史). 预热后在测量窗口内统计:
+- jitter: 每个客户端相邻样本到达间隔与采样间隔之差的平均绝对值, 取各客户端的分布
+- latency: 样本到达时间减去服务端采样时间戳 (同一台机器, 时钟一致)
+- 服务端进程的 CPU 占用率和常驻内存, 所有客户端合计每秒收到的字节数
+- 工作进程自身的 CPU 占用率: 接近 工作进程数 x 100% 时延迟和抖动主要来自测试端, 应增加 --workers
+结果以 JSON 输出, 可保存后在不同版本之间比较.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'client'))
+from monitor_stream import PROTOCOL_VERSION, StatsStream
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="模拟大量客户端对本地服务端进行负载测试")
+    parser.add_argument('--server', default=os.path.join(ROOT, 'server', 'server-linux.py'))
+    parser.add_argument('--port', type=int, default=5098)
+    parser.add_argument('--clients', default='10,100,1000', help="每一档的客户端数, 逗号分隔")
+    parser.add_argument('--workers', type=int, default=max(1, min(4, (os.cpu_count() or 1) - 1)),
+                        help="运行客户端的工作进程数")
+    parser.add_argument('--interval', type=float, default=1, help="客户端请求的采样间隔 (秒)")
+    parser.add_argument('--format', choices=('binary', 'json'), default='binary')
+    parser.add_argument('--no-delta', action='store_true', help="不使用增量传输")
+    parser.add_argument('--per-cpu', action='store_true', help="订阅每个核心的占用率")
+    parser.add_argument('--warmup', type=float, default=3, help="建立连接后等待的秒数")
+    parser.add_argument('--seconds', type=float, default=10, help="每一档的测量时长")
+    parser.add_argument('--server-args', default='', help="传给服务端的其他参数, 如 \"--collector synthetic --synthetic cores=256\"")
+    parser.add_argument('--output', default=None, metavar='FILE', help="同时把结果写入该文件")
+    return parser.parse_args()
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+def summary(values, scale=1000, digits=3):
+    # 默认把秒换算为毫秒
+    if not values:
+        return None
+    return {
+        'p50': round(percentile(values, 0.5) * scale, digits),
+        'p99': round(percentile(values, 0.99) * scale, digits),
+        'max': round(max(values) * scale, digits)
+    }
+
+class LoadClient(asyncio.Protocol):
+    """只解析数据流并记录到达时间; 用协议回调而不是每次读取一个协程, 以免测试端本身成为瓶颈"""
+
+    def __init__(self, hello, start, end):
+        self.hello = hello
+        self.start = start
+        self.end = end
+        self.stream = StatsStream()
+        self.result = {'bytes': 0, 'arrivals': [], 'latencies': []}
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.write(self.hello)
+
+    def data_received(self, data):
+        now = time.time()
+        samples = self.stream.feed(data)
+        if now < self.start or now >= self.end:
+            return
+        result = self.result
+        result['bytes'] += len(data)
+        for stats in samples:
+            result['arrivals'].append(now)
+            result['latencies'].append(now - stats['timestamp'])
+
+    def connection_lost(self, exc):
+        if self.transport is not None and time.time() < self.end:
+            self.result['closed'] = True
+        self.transport = None
+
+async def connect(loop, port, client):
+    try:
+        await loop.create_connection(lambda: client, '127.0.0.1', port)
+    except OSError as e:
+        client.result['error'] = str(e)
+
+async def run_clients(count, port, hello, start, end):
+    loop = asyncio.get_running_loop()
+    clients = [LoadClient(hello, start, end) for _ in range(count)]
+    await asyncio.gather(*(connect(loop, port, client) for client in clients))
+    await asyncio.sleep(max(0, start - time.time()))
+    cpu_start = time.process_time()
+    await asyncio.sleep(max(0, end - time.time()))
+    cpu = time.process_time() - cpu_start
+    for client in clients:
+        if client.transport is not None:
+            client.transport.close()
+    return cpu, [client.result for client in clients]
+
+def run_worker(job):
+    count, port, hello, start, end = job
+    return asyncio.run(run_clients(count, port, hello, start, end))
+
+def raise_file_limit(needed):
+    # 每个客户端占用一个文件描述符, 工作进程继承放宽后的限制
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+def run_step(args, clients, pool):
+    server = subprocess.Popen(
+        [sys.executable, args.server, '--host', '127.0.0.1', '--port', str(args.port),
+         '--interval', str(args.interval), '--min-interval', str(min(0.1, args.interval)),
+         *args.server_args.split()],
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        time.sleep(1)
+        proc = psutil.Process(server.pid)
+        hello = json.dumps({
+            'type': 'hello',
+            'version': PROTOCOL_VERSION,
+            'format': args.format,
+            'delta': not args.no_delta,
+            'groups': ['cpu', 'memory', 'network'],
+            'per_cpu': args.per_cpu,
+            'interval': args.interval
+        }).encode('utf-8') + b'\n'
+        start = time.time() + args.warmup
+        end = start + args.seconds
+        workers = min(args.workers, clients)
+        jobs = [(clients // workers + (i < clients % workers), args.port, hello, start, end) for i in range(workers)]
+        pending = pool.map_async(run_worker, jobs)
+
+        time.sleep(max(0, start - time.time()))
+        cpu_start = sum(proc.cpu_times()[:2])
+        wall_start = time.perf_counter()
+        rss = []
+        while time.time() < end:
+            rss.append(proc.memory_info().rss)
+            time.sleep(min(0.5, max(0, end - time.time())))
+        cpu = sum(proc.cpu_times()[:2]) - cpu_start
+        wall = time.perf_counter() - wall_start
+        batches = pending.get()
+        client_cpu = sum(cpu for cpu, _ in batches)
+        results = [result for _, batch in batches for result in batch]
+    finally:
+        server.terminate()
+        server.wait()
+
+    jitters = []
+    latencies = []
+    samples = 0
+    for result in results:
+        arrivals = result['arrivals']
+        samples += len(arrivals)
+        latencies += result['latencies']
+        gaps = [b - a for a, b in zip(arrivals, arrivals[1:])]
+        if gaps:
+            jitters.append(statistics.mean(abs(gap - args.interval) for gap in gaps))
+    return {
+        'clients': clients,
+        'connected': sum('error' not in result for result in results),
+        'dropped': sum(result.get('closed', False) for result in results),
+        'samples': samples,
+        'samples_per_client': round(samples / clients, 2),
+        'jitter_ms': summary(jitters),
+        'latency_ms': summary(latencies),
+        'bytes_per_second': round(sum(result['bytes'] for result in results) / args.seconds),
+        'server_cpu_percent': round(cpu / wall * 100, 2),
+        'server_rss_mb': round(max(rss) / 2 ** 20, 1) if rss else None,
+        'client_cpu_percent': round(client_cpu / args.seconds * 100, 2)
+    }
+
+def main():
+    args = parse_args()
+    steps = [int(n) for n in args.clients.split(',') if n.strip()]
+    raise_file_limit(max(steps) + 256)
+    report = {
+        'server': os.path.basename(args.server),
+        'interval': args.interval,
+        'format': args.format,
+        'delta': not args.no_delta,
+        'per_cpu': args.per_cpu,
+        'seconds': args.seconds,
+        'workers': args.workers,
+        'cores': os.cpu_count(),
+        'steps': []
+    }
+    with multiprocessing.Pool(args.workers) as pool:
+        for clients in steps:
+            report['steps'].append(run_step(args, clients, pool))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+if __name__ == "__main__":
+    main()
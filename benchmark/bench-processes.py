@@ -0,0 +1,91 @@
+"""测量服务端进程列表采集的耗时
+
+先启动一批空闲子进程把进程数撑到指定规模 (默认 5000 个以上), 然后分别计时:
+- cached: 服务端的 ProcessCollector, 按 pid 缓存进程对象并预取属性
+- naive: 每次为每个 pid 新建 psutil.Process 再逐个读取属性
+结果以 JSON 输出.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLATFORM = {'win32': 'windows', 'darwin': 'macos'}.get(sys.platform, 'linux')
+
+def load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="测量进程列表采集的耗时")
+    parser.add_argument('--server', default=os.path.join(ROOT, 'server', f'server-{PLATFORM}.py'))
+    parser.add_argument('--processes', type=int, default=5000, help="目标进程数, 不足时启动空闲子进程补足")
+    parser.add_argument('--rounds', type=int, default=20, help="每种方式采集的次数")
+    parser.add_argument('--top', type=int, default=10)
+    return parser.parse_args()
+
+def spawn(children, count):
+    # 子进程只是休眠, 内存占用很小; 不与父进程保持管道, 进程数不受文件描述符上限的限制.
+    # 边启动边加入 children, 中途失败时调用方也能结束已启动的子进程
+    command = ['ping', '-n', '86400', '127.0.0.1'] if sys.platform == 'win32' else ['sleep', '86400']
+    for _ in range(count):
+        children.append(subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.DEVNULL))
+
+def naive_collect(top):
+    rows = []
+    for pid in psutil.pids():
+        try:
+            proc = psutil.Process(pid)
+            rows.append((proc.cpu_percent(), proc.memory_info().rss, pid, proc.name(), proc.username()))
+        except (psutil.Error, KeyError):
+            continue
+    rows.sort(reverse=True)
+    return rows[:top]
+
+def measure(collect, rounds):
+    collect()
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        collect()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'mean_ms': round(statistics.mean(timings), 3),
+        'p50_ms': round(timings[len(timings) // 2], 3),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 3)
+    }
+
+def main():
+    args = parse_args()
+    server = load_module(args.server, 'server_app')
+    children = []
+    try:
+        spawn(children, max(0, args.processes - len(psutil.pids())))
+        collector = server.ProcessCollector(args.top)
+        results = {
+            'processes': len(psutil.pids()),
+            'rounds': args.rounds,
+            'cached': measure(collector.collect, args.rounds),
+            'naive': measure(lambda: naive_collect(args.top), args.rounds)
+        }
+        results['speedup'] = round(results['naive']['mean_ms'] / results['cached']['mean_ms'], 2)
+        print(json.dumps(results, indent=2))
+    finally:
+        for child in children:
+            child.terminate()
+        for child in children:
+            child.wait()
+
+if __name__ == "__main__":
+    main()
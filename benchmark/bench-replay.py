@@ -0,0 +1,105 @@
+"""以最快速度回放录制文件, 测量客户端解析和记录历史的吞吐量
+
+没有指定录制文件时, 用服务端的 SyntheticCollector (虚拟时钟, 每秒一个样本) 生成数据,
+再由 StreamRecorder 按二进制增量格式写成录制文件, 核心数和网卡数可调. 回放经过与实时连接相同的 ReplayManager 路径, 分别测量:
+- stream: 只解析数据流并合并到最新数据 (HostConnection)
+- history: 再加上图形客户端的历史记录 (HostState)
+绘图部分需要图形界面, 可用 client-<平台>.py --replay FILE --speed 0 在状态栏查看吞吐量.
+结果以 JSON 输出.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLATFORM = {'win32': 'windows', 'darwin': 'macos'}.get(sys.platform, 'linux')
+
+def load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="测量录制文件最快速回放的吞吐量")
+    parser.add_argument('--client', default=os.path.join(ROOT, 'client', f'client-{PLATFORM}.py'))
+    parser.add_argument('--server', default=os.path.join(ROOT, 'server', f'server-{PLATFORM}.py'))
+    parser.add_argument('--recording', default=None, help="要回放的录制文件, 不指定时生成合成录制")
+    parser.add_argument('--samples', type=int, default=20000, help="合成录制的样本数")
+    parser.add_argument('--hosts', type=int, default=1, help="合成录制的数据流 (服务器) 数")
+    parser.add_argument('--cores', type=int, default=8, help="合成数据的核心数")
+    parser.add_argument('--nics', type=int, default=2, help="合成数据的网卡数")
+    parser.add_argument('--rounds', type=int, default=3, help="每种方式回放的次数, 取最快一次")
+    return parser.parse_args()
+
+def synthesize(server, path, samples, hosts, cores, nics):
+    # 每个数据流一个只有 listeners 的数据源, 录制器对其每个样本都写入一帧
+    sources = {f"host{i}:5021": types.SimpleNamespace(listeners=[]) for i in range(hosts)}
+    recorder = server.StreamRecorder(path, sources)
+    start = time.time()
+    try:
+        for index, source in enumerate(sources.values()):
+            clock = [0.0]
+            collector = server.SyntheticCollector(cores, nics, seed=index, clock=lambda: clock[0])
+            # 与采样线程相同, 占用率和速度由相邻两次采集的累计计数算出
+            last = server.take_counters(collector.collect(server.STATS_GROUPS, True), clock[0])
+            for n in range(samples):
+                clock[0] += 1
+                stats = collector.collect(server.STATS_GROUPS, True)
+                stats['timestamp'] = start + n
+                counters = server.take_counters(stats, clock[0])
+                sample = server.window_stats(stats, counters, last, 1.0)
+                last = counters
+                for listener in source.listeners:
+                    listener(sample, {})
+    finally:
+        recorder.close()
+
+def replay(stream, path, make_host, rounds):
+    best = None
+    for _ in range(rounds):
+        names = stream.recording_streams(path)
+        manager = stream.ReplayManager({name: make_host(name) for name in names}, path, speed=0)
+        manager.run()
+        if best is None or manager.elapsed < best.elapsed:
+            best = manager
+    return {
+        'samples': best.samples,
+        'seconds': round(best.elapsed, 4),
+        'samples_per_second': round(best.samples / best.elapsed) if best.elapsed else None,
+        'us_per_sample': round(best.elapsed / best.samples * 1e6, 2) if best.samples else None
+    }
+
+def main():
+    args = parse_args()
+    # 客户端从所在目录导入 monitor_stream
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.client)))
+    stream = importlib.import_module('monitor_stream')
+    client = load_module(args.client, 'client_app')
+    path = args.recording
+    if path is None:
+        server = load_module(args.server, 'server_app')
+        fd, path = tempfile.mkstemp(suffix='.rec')
+        os.close(fd)
+        os.remove(path)
+        synthesize(server, path, args.samples, args.hosts, args.cores, args.nics)
+    try:
+        results = {
+            'recording': os.path.basename(path) if args.recording else f"synthetic ({args.cores} cores)",
+            'bytes': os.path.getsize(path),
+            'stream': replay(stream, path, lambda name: stream.HostConnection(name, 0), args.rounds),
+            'history': replay(stream, path, lambda name: client.HostState(name, 0, 3600), args.rounds)
+        }
+        results['bytes_per_sample'] = round(results['bytes'] / max(results['stream']['samples'], 1), 1)
+        print(json.dumps(results, indent=2))
+    finally:
+        if args.recording is None:
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
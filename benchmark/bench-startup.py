@@ -0,0 +1,116 @@
+"""测量图形客户端的启动耗时 (需要图形界面环境)
+
+启动一个本地服务端, 每轮在新的子进程中启动客户端, 记录从创建子进程起到以下时刻的耗时:
+- import: 客户端模块导入完成
+- first_window: 主窗口第一次映射到屏幕
+- first_sample: 收到第一个样本
+- first_chart: 初始页面的图表第一次绘制完成
+多轮取中位数, 以 JSON 输出.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLATFORM = {'win32': 'windows', 'darwin': 'macos'}.get(sys.platform, 'linux')
+MILESTONES = ('import', 'first_window', 'first_sample', 'first_chart')
+
+def load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="测量客户端的启动耗时")
+    parser.add_argument('--client', default=os.path.join(ROOT, 'client', f'client-{PLATFORM}.py'))
+    parser.add_argument('--server', default=os.path.join(ROOT, 'server', f'server-{PLATFORM}.py'))
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--rounds', type=int, default=5, help="启动客户端的次数")
+    parser.add_argument('--timeout', type=float, default=30, help="单轮最长等待时间 (秒)")
+    parser.add_argument('--child', nargs=2, metavar=('CONFIG', 'SPAWNED'), help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def run_child(args):
+    # 子进程: 时间以父进程创建子进程的时刻为起点, 包含解释器自身的启动
+    config_file, spawned = args.child[0], float(args.child[1])
+    times = {}
+
+    def mark(name):
+        if name not in times:
+            times[name] = round((time.time() - spawned) * 1000, 1)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.client)))
+    client = load_module(args.client, 'client_app')
+    mark('import')
+    client.ServerMonitorApp.CONFIG_FILE = config_file
+
+    ingest = client.HostState.ingest
+    def timed_ingest(state, new_data):
+        ingest(state, new_data)
+        mark('first_sample')
+    client.HostState.ingest = timed_ingest
+
+    create_chart = client.ServerMonitorApp.create_chart
+    def timed_create_chart(app, page):
+        create_chart(app, page)
+        if page in app.chart_timers:
+            mark('first_chart')
+    client.ServerMonitorApp.create_chart = timed_create_chart
+
+    root = client.tk.Tk()
+    root.bind('<Map>', lambda event: mark('first_window'), add='+')
+    app = client.ServerMonitorApp(root)
+    deadline = time.time() + args.timeout
+
+    def check():
+        if all(name in times for name in MILESTONES) or time.time() > deadline:
+            app.on_close()
+        else:
+            root.after(10, check)
+
+    root.after(10, check)
+    root.mainloop()
+    print(json.dumps(times))
+
+def main():
+    args = parse_args()
+    if args.child:
+        run_child(args)
+        return
+    server = subprocess.Popen(
+        [sys.executable, args.server, '--host', '127.0.0.1', '--port', str(args.port)],
+        stdout=subprocess.DEVNULL
+    )
+    config_dir = tempfile.mkdtemp()
+    config_file = os.path.join(config_dir, 'bench.ipcfg')
+    with open(config_file, 'w') as f:
+        f.write(f"[SERVER]\nhost = 127.0.0.1\nport = {args.port}\n")
+
+    try:
+        time.sleep(1)
+        rounds = []
+        for _ in range(args.rounds):
+            output = subprocess.check_output([
+                sys.executable, os.path.abspath(__file__), '--client', args.client,
+                '--timeout', str(args.timeout), '--child', config_file, repr(time.time())
+            ])
+            rounds.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+        results = {'client': os.path.basename(args.client), 'rounds': args.rounds, 'median_ms': {}}
+        for name in MILESTONES:
+            values = [times[name] for times in rounds if name in times]
+            results['median_ms'][name] = round(statistics.median(values), 1) if values else None
+        results['runs_ms'] = rounds
+        print(json.dumps(results, indent=2))
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""命令行客户端: 不依赖 tkinter 和 matplotlib, 适合 SSH 会话和脚本
+
+在终端中以表格实时显示一台或多台服务器的概要数据; 输出不是终端或指定 --json 时,
+每收到一个样本输出一行 JSON, 便于管道处理.
+"""
+import argparse
+import json
+import sys
+import threading
+import unicodedata
+
+from monitor_stream import (
+    PROTOCOL_VERSION, ConnectionManager, HostConnection, ReplayManager, StreamRecorder,
+    convert_speed, parse_hosts, recording_streams
+)
+
+COLUMNS = (("服务器", 28), ("CPU", 8), ("内存", 8), ("上传", 14), ("下载", 14), ("状态", 0))
+
+def text_width(text):
+    return sum(2 if unicodedata.east_asian_width(ch) in 'WF' else 1 for ch in text)
+
+def pad(text, width):
+    return text + ' ' * max(width - text_width(text), 1)
+
+class CliHost(HostConnection):
+    def __init__(self, host, port, source, cli):
+        super().__init__(host, port, source)
+        self.cli = cli
+        self.samples = 0
+
+    def ingest(self, new_data):
+        # JSON 输出保留服务端的原始数据 (速度单位为字节/秒), 在换算之前写出
+        self.samples += 1
+        self.cli.on_sample(self, new_data)
+        super().ingest(new_data)
+
+class MonitorCli:
+    def __init__(self, args):
+        self.args = args
+        self.groups = [group.strip() for group in args.groups.split(',') if group.strip()]
+        self.json_output = args.json or not sys.stdout.isatty()
+        # 回放模式下服务器列表来自录制文件
+        self.streams = recording_streams(args.replay) if args.replay else []
+        hosts = ' '.join(self.streams) if args.replay else ' '.join(args.hosts)
+        self.hosts = [CliHost(host, port, source, self) for host, port, source in parse_hosts(hosts, args.port)]
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+    def hello(self, state):
+        message = {
+            'type': 'hello',
+            'version': PROTOCOL_VERSION,
+            'format': self.args.format,
+            'delta': not self.args.no_delta,
+            'groups': self.groups,
+            'per_cpu': self.args.per_cpu,
+            'interval': self.args.interval
+        }
+        if state.source:
+            message['source'] = state.source
+        return json.dumps(message).encode('utf-8') + b'\n'
+
+    def history_query(self, state):
+        return None
+
+    def on_sample(self, state, stats):
+        # 由连接线程调用; 达到 --count 后主线程停止连接之前可能还会收到样本, 不再输出
+        if self.args.count and state.samples > self.args.count:
+            return
+        if self.json_output:
+            line = json.dumps(dict(stats, host=state.name), ensure_ascii=False)
+            with self.lock:
+                sys.stdout.write(line + '\n')
+                sys.stdout.flush()
+        if self.args.count and all(host.samples >= self.args.count for host in self.hosts):
+            self.done.set()
+
+    def render(self):
+        lines = [''.join(pad(title, width) if width else title for title, width in COLUMNS)]
+        for state in self.hosts:
+            if state.connected and state.samples:
+                cpu = state.data['cpu']
+                memory = state.data['memory']
+                network = state.data['network']
+                upload = ' '.join(convert_speed(network.get('upload_speed')))
+                download = ' '.join(convert_speed(network.get('download_speed')))
+                values = (state.name, f"{cpu['percent']:.1f}%", f"{memory['percent']:.1f}%", upload, download, "在线")
+            else:
+                values = (state.name, '-', '-', '-', '-', state.status)
+            lines.append(''.join(pad(value, width) if width else value for value, (_, width) in zip(values, COLUMNS)))
+            per_cpu = state.data['cpu'].get('per_cpu') if self.args.per_cpu else None
+            if per_cpu:
+                lines.append('    ' + ' '.join(f"{usage:4.0f}" for usage in per_cpu))
+        # 光标回到左上角后重写整屏, 并清除上一次多出的内容
+        sys.stdout.write('\x1b[H' + '\x1b[K\n'.join(lines) + '\x1b[K\n\x1b[J')
+        sys.stdout.flush()
+
+    def run(self):
+        recorder = None
+        if self.args.replay:
+            manager = ReplayManager(dict(zip(self.streams, self.hosts)), self.args.replay, self.args.speed)
+        else:
+            recorder = StreamRecorder(self.args.record) if self.args.record else None
+            manager = ConnectionManager(self, self.hosts, recorder)
+        manager.start()
+        try:
+            # 回放结束或收到足够的样本后退出
+            if self.json_output:
+                while manager.is_alive() and not self.done.wait(0.5):
+                    pass
+            else:
+                sys.stdout.write('\x1b[2J')
+                while manager.is_alive() and not self.done.wait(self.args.interval / 2):
+                    self.render()
+                self.render()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            manager.stop()
+            manager.join(timeout=1)
+            if recorder is not None:
+                recorder.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="服务器性能监控命令行客户端")
+    parser.add_argument('hosts', nargs='*', default=['localhost'],
+                        help="服务器地址 (host[:port], 中继模式下为 source@relay:port), 可指定多个")
+    parser.add_argument('--port', type=int, default=5021, help="未指定端口时使用的端口")
+    parser.add_argument('--interval', type=float, default=1, help="请求的采样间隔 (秒)")
+    parser.add_argument('--format', choices=('binary', 'json'), default='binary', help="数据传输格式")
+    parser.add_argument('--no-delta', action='store_true', help="不使用增量传输")
+    parser.add_argument('--groups', default='cpu,memory,network', help="订阅的指标分组, 逗号分隔")
+    parser.add_argument('--per-cpu', action='store_true', help="同时订阅并显示每个核心的占用率")
+    parser.add_argument('--json', action='store_true', help="每个样本输出一行 JSON (输出不是终端时默认如此)")
+    parser.add_argument('--count', type=int, default=0, help="每台服务器收到这么多样本后退出, 0 表示一直运行")
+    parser.add_argument('--record', default=None, metavar='FILE', help="把收到的原始数据追加录制到该文件")
+    parser.add_argument('--replay', default=None, metavar='FILE', help="回放录制文件, 不连接服务器")
+    parser.add_argument('--speed', type=float, default=1, help="回放速度倍数, 0 表示以最快速度回放")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    MonitorCli(parse_args()).run()
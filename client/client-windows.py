@@ -1,112 +1,448 @@
+import argparse
 import socket
 import json
 import tkinter as tk
 from tkinter import ttk
-import threading
-import time
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import configparser
 import os
-from matplotlib.animation import FuncAnimation
-import matplotlib
-matplotlib.use('TkAgg')
+import numpy as np
+from monitor_stream import (
+    PROTOCOL_VERSION, ConnectionManager, HostConnection, ReplayManager, StreamRecorder,
+    convert_speed, format_bytes, format_hosts, parse_hosts, recording_streams
+)
+
+# 导入 matplotlib 及其 Tk 后端约占启动时间的一半, 推迟到第一次显示图表页面时
+Figure = FigureCanvasTkAgg = PolyCollection = None
+
+def load_matplotlib():
+    global Figure, FigureCanvasTkAgg, PolyCollection
+    if Figure is None:
+        import matplotlib
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.collections import PolyCollection
+        from matplotlib.figure import Figure
+        matplotlib.rcParams['font.family'] = 'Microsoft YaHei'
+
+class RingBuffer:
+    """定长环形缓冲区. 每个值写入两份, 最近 n 个值在内存中始终连续, view() 不拷贝数据"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity * 2)
+        self.index = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.index = 0
+        self.count = 0
+
+    def append(self, value):
+        self.buffer[self.index] = value
+        self.buffer[self.index + self.capacity] = value
+        self.index = (self.index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def view(self, n=None):
+        n = self.count if n is None else min(n, self.count)
+        end = self.index + self.capacity
+        return self.buffer[end - n:end]
+
+def fill_verts(values):
+    # 折线下方填充区域的多边形顶点, 替代每帧重新 fill_between
+    if not len(values):
+        return []
+    x = np.arange(len(values))
+    return [np.column_stack((
+        np.concatenate(([0], x, [x[-1]])),
+        np.concatenate(([0], values, [0]))
+    ))]
+
+class BlitManager:
+    """缓存图表背景, 每帧只恢复背景并重绘动态元素; 坐标轴变化时才整体重绘"""
+
+    def __init__(self, canvas, artists):
+        self.canvas = canvas
+        self.artists = []
+        self.background = None
+        self.set_artists(artists)
+        canvas.mpl_connect('draw_event', self.on_draw)
+
+    def set_artists(self, artists):
+        for artist in artists:
+            artist.set_animated(True)
+        self.artists = list(artists)
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        for artist in self.artists:
+            self.canvas.figure.draw_artist(artist)
+
+    def update(self, redraw=False):
+        if redraw or self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+class SpeedChart:
+    """两条速度曲线 (上传/下载、读取/写入) 及填充区域, 纵轴单位随数值大小切换, 数据单位为 KB/s"""
+
+    def __init__(self, canvas, ax, labels):
+        self.ax = ax
+        self.labels = labels
+        self.lines = [ax.plot([], [], color=color, linewidth=2)[0] for color in ('#0099FF', '#00CC99')]
+        self.fills = [ax.add_collection(PolyCollection([], color=color, alpha=0.5)) for color in ('#87CEFA', '#90EE90')]
+        self.unit = None
+        self.top = None
+        self.set_unit('KB/s')
+        self.blit = BlitManager(canvas, [*self.fills, *self.lines])
+
+    def set_unit(self, unit):
+        self.unit = unit
+        for line, label in zip(self.lines, self.labels):
+            line.set_label(f'{label} ({unit})')
+        self.ax.set_ylabel(f'速度 ({unit})', color='white')
+        self.ax.legend(facecolor='#333333', labelcolor='white')
+
+    def reset(self):
+        self.top = None
+
+    def update(self, histories, current, visible):
+        has_history = all(len(history) > 0 for history in histories)
+        max_value = max(*(history.max(initial=0) for history in histories), *current)
+        min_value = min(*(history.min() for history in histories), *current) if has_history else 0
+
+        if max_value >= 1024 * 1024:
+            unit = 'GB/s'
+            scale = 1024 * 1024
+        elif max_value >= 1024:
+            unit = 'MB/s'
+            scale = 1024
+        elif min_value < 1 and max_value < 1024:
+            unit = 'B/s'
+            scale = 1
+        else:
+            unit = 'KB/s'
+            scale = 1
+        histories = [history / scale for history in histories]
+
+        # 单位或纵轴范围变化时整体重绘, 纵轴留有余量避免每帧重绘
+        redraw = False
+        if unit != self.unit:
+            self.set_unit(unit)
+            redraw = True
+        top = max(max_value / scale * 1.1, 1)
+        if self.top is None or top > self.top or top < self.top * 0.5:
+            self.top = top * 1.2
+            self.ax.set_ylim(0, self.top)
+            redraw = True
+
+        for line, fill, history in zip(self.lines, self.fills, histories):
+            line.set_data(np.arange(len(history)), history)
+            fill.set_verts(fill_verts(history))
+        if visible:
+            self.blit.update(redraw)
+
+SPARK_WIDTH = 240
+SPARK_HEIGHT = 40
+
+def spark_coords(values, top, window):
+    # 迷你折线图的画布坐标, 数据不足两个点时返回 None
+    if len(values) < 2 or not top:
+        return None
+    x = np.arange(len(values)) * (SPARK_WIDTH / max(window - 1, 1))
+    y = SPARK_HEIGHT - np.clip(values / top, 0, 1) * (SPARK_HEIGHT - 2) - 1
+    return np.column_stack((x, y)).ravel().tolist()
+
+class HostState(HostConnection):
+    """图形客户端中的一台服务器: 在连接状态和最新数据之外保存各项指标的历史"""
+
+    def __init__(self, host, port, capacity, source=None):
+        super().__init__(host, port, source)
+        self.history = {
+            'cpu': RingBuffer(capacity),
+            'memory': RingBuffer(capacity),
+            'network': {
+                'upload': RingBuffer(capacity),
+                'download': RingBuffer(capacity)
+            },
+            'disk': {
+                'read': RingBuffer(capacity),
+                'write': RingBuffer(capacity)
+            },
+            'interfaces': {}
+        }
+        self.capacity = capacity
+        # 最近一次发给服务端的订阅, 内容不变时不重复发送
+        self.subscribed = None
+
+    def update_history_data(self, new_data):
+        if 'cpu' in new_data:
+            self.history['cpu'].append(new_data['cpu']['percent'])
+
+        if 'memory' in new_data:
+            self.history['memory'].append(new_data['memory']['used'] / (1024**3))
+
+        if 'upload_speed' in new_data.get('network', {}):
+            self.history['network']['upload'].append(new_data['network']['upload_speed'])
+            self.history['network']['download'].append(new_data['network']['download_speed'])
+
+        # 只为界面上选中过的网卡保存历史, 避免为大量虚拟网卡分配缓冲区
+        interfaces = new_data.get('interfaces', {})
+        for name, history in list(self.history['interfaces'].items()):
+            nic = interfaces.get(name)
+            if nic is not None:
+                history['upload'].append(nic['upload_speed'])
+                history['download'].append(nic['download_speed'])
+
+        # 磁盘速度由服务端计算, 单位为字节/秒, 历史与网络一致按 KB/s 保存
+        if 'read_speed' in new_data.get('disk', {}):
+            self.history['disk']['read'].append(new_data['disk']['read_speed'] / 1024)
+            self.history['disk']['write'].append(new_data['disk']['write_speed'] / 1024)
+
+    def interface_history(self, name):
+        history = self.history['interfaces'].get(name)
+        if history is None:
+            history = {'upload': RingBuffer(self.capacity), 'download': RingBuffer(self.capacity)}
+            self.history['interfaces'][name] = history
+        return history
+
+    def prefill(self, reply):
+        # 服务端返回的历史按桶平均值插在连接后已收到的实时数据之前
+        series = reply.get('series', {})
+        for metric, history, scale in (
+            ('cpu.percent', self.history['cpu'], 1),
+            ('memory.used', self.history['memory'], 1 / (1024**3)),
+            ('network.upload_speed', self.history['network']['upload'], 1 / 1024),
+            ('network.download_speed', self.history['network']['download'], 1 / 1024)
+        ):
+            values = [v for v in series.get(metric, {}).get('avg', []) if v is not None]
+            if not values:
+                continue
+            live = history.view().copy()
+            history.clear()
+            for value in values[:-len(live) or None]:
+                history.append(value * scale)
+            for value in live:
+                history.append(value)
 
 class ServerMonitorApp:
     CONFIG_FILE = "codewaves.stats.ipcfg"
     
-    def __init__(self, root):
+    def __init__(self, root, record=None, replay=None, speed=1):
         self.root = root
-        self.root.title("服务器监控工具")
+        self.root.title(f"服务器监控工具 - 回放 {replay}" if replay else "服务器监控工具")
         self.root.geometry("1300x850")
         self.root.configure(bg='#222222')
-        self.data = {
-            'cpu': {'percent': 0, 'per_cpu': [], 'freq': 0},
-            'memory': {'used': 0, 'total': 0, 'percent': 0},
-            'network': {'bytes_sent': 0, 'bytes_recv': 0, 'upload_speed': 0, 'download_speed': 0}
-        }
-        self.history = {
-            'cpu': [],
-            'memory': [],
-            'network': {'upload': [], 'download': []}
-        }
         self.config = configparser.ConfigParser()
         self.load_config()
+        # 回放模式下服务器列表来自录制文件, 不连接设置中的服务器
+        self.replay = replay
+        self.replay_speed = speed
+        self.replay_streams = recording_streams(replay) if replay else []
+        self.replay_hosts = parse_hosts(' '.join(self.replay_streams))
+        self.recorder = StreamRecorder(record) if record and not replay else None
+        self.create_hosts()
         self.font = ('Microsoft YaHei', 10)
         self.title_font = ('Microsoft YaHei', 16, 'bold')
+        self.manager = None
+        self.fleet_job = None
+        self.shown_status = None
+        self.shown_processes = None
+        self.shown_disk = None
+        self.process_sort = 'cpu'
+        self.cpu_bars = None
+        self.mem_total = None
+        self.net_chart = None
+        self.disk_chart = None
+        self.chart_builders = {
+            'cpu': self.create_cpu_chart,
+            'memory': self.create_mem_chart,
+            'network': self.create_net_chart,
+            'disk': self.create_disk_chart
+        }
+        self.chart_timers = {}
         self.create_main_layout()
+        self.create_fleet_page()
         self.create_cpu_page()
         self.create_memory_page()
         self.create_network_page()
+        self.create_disk_page()
+        self.create_process_page()
         self.create_settings_page()
-        self.show_page("cpu")
+        self.update_fleet_nav()
+        self.show_page("fleet" if self.fleet_mode else "cpu")
         self.running = True
-        self.thread = threading.Thread(target=self.update_data)
-        self.thread.daemon = True
-        self.thread.start()
-        self.init_all_charts()
-        self.ani_cpu = FuncAnimation(
-            self.cpu_fig,
-            self.update_cpu_chart,
-            interval=500,
-            cache_frame_data=False,
-            save_count=100
-        )
-        self.ani_mem = FuncAnimation(
-            self.mem_fig,
-            self.update_mem_chart,
-            interval=500,
-            cache_frame_data=False,
-            save_count=100
-        )
-        self.ani_net = FuncAnimation(
-            self.net_fig,
-            self.update_net_chart,
-            interval=500,
-            cache_frame_data=False,
-            save_count=100
-        )
+        self.start_connections()
         self.update_ui()
 
-    def init_all_charts(self):
-        self.cpu_ax1.clear()
-        self.cpu_ax2.clear()
-        self.cpu_ax1.set_facecolor('#333333')
-        self.cpu_ax2.set_facecolor('#333333')
+    # 图表和概览页面显示的始终是当前选中的服务器
+    @property
+    def data(self):
+        return self.selected.data
+
+    @property
+    def history(self):
+        return self.selected.history
+
+    @property
+    def fleet_mode(self):
+        if self.replay:
+            return len(self.replay_hosts) > 1
+        return len(self.fleet_hosts) > 0
+
+    def configured_hosts(self):
+        if self.replay:
+            return self.replay_hosts
+        # 配置了集群主机时进入总览模式, 否则只连接设置中的单台服务器
+        if self.fleet_mode:
+            return self.fleet_hosts
+        return [(self.server_host, self.server_port, None)]
+
+    def create_hosts(self):
+        capacity = self.fleet_capacity if self.fleet_mode else self.history_capacity
+        self.hosts = [HostState(host, port, capacity, source) for host, port, source in self.configured_hosts()]
+        self.selected = self.hosts[0]
+
+    def start_connections(self):
+        if self.replay:
+            streams = dict(zip(self.replay_streams, self.hosts))
+            self.manager = ReplayManager(streams, self.replay, self.replay_speed)
+        else:
+            self.manager = ConnectionManager(self, self.hosts, self.recorder)
+        self.manager.start()
+
+    def stop_connections(self):
+        if self.manager is not None and self.manager.is_alive():
+            self.manager.stop()
+            self.manager.join(timeout=1)
+
+    def create_chart(self, page):
+        # 页面第一次显示时才创建图表, 窗口和服务器连接不必等待 matplotlib
+        if page in self.chart_timers or not self.running:
+            return
+        load_matplotlib()
+        canvas, update = self.chart_builders[page]()
+        canvas.draw()
+        timer = canvas.new_timer(interval=self.refresh_interval())
+        timer.add_callback(update)
+        self.chart_timers[page] = (timer, update)
+        if page == self.current_page:
+            self.schedule_charts()
+
+    def new_chart(self, master, rows=1, figsize=(10, 5), **kwargs):
+        fig = Figure(figsize=figsize, facecolor='#333333')
+        axes = fig.subplots(rows, 1, **kwargs)
+        for ax in fig.axes:
+            ax.set_facecolor('#333333')
+            ax.tick_params(colors='white')
+            for spine in ax.spines.values():
+                spine.set_color('white')
+            ax.xaxis.label.set_color('white')
+            ax.yaxis.label.set_color('white')
+        canvas = FigureCanvasTkAgg(fig, master=master)
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        return canvas, axes
+
+    def create_cpu_chart(self):
+        self.cpu_canvas, (self.cpu_ax1, self.cpu_ax2) = self.new_chart(
+            self.cpu_chart_frame, 2, (10, 6), gridspec_kw={'height_ratios': [1, 2]}
+        )
         self.cpu_ax1.set_ylabel('总使用率 (%)', color='white')
         self.cpu_ax2.set_ylabel('使用率 (%)', color='white')
         self.cpu_ax1.set_ylim(0, 100)
         self.cpu_ax2.set_ylim(0, 100)
-        self.mem_ax.clear()
-        self.mem_ax.set_facecolor('#333333')
+        self.cpu_ax1.set_xlim(0, max(self.history_window - 1, 1))
+        # 图表元素只创建一次, 之后每帧只更新数据
+        self.cpu_line, = self.cpu_ax1.plot([], [], color='#0099FF', linewidth=2)
+        self.cpu_fill = self.cpu_ax1.add_collection(PolyCollection([], color='#87CEFA', alpha=0.5))
+        self.cpu_blit = BlitManager(self.cpu_canvas, [self.cpu_line, self.cpu_fill])
+        return self.cpu_canvas, self.update_cpu_chart
+
+    def create_mem_chart(self):
+        self.mem_canvas, self.mem_ax = self.new_chart(self.mem_chart_frame)
         self.mem_ax.set_ylabel('内存 (GB)', color='white')
         self.mem_ax.set_xlabel('时间', color='white')
-        self.net_ax.clear()
-        self.net_ax.set_facecolor('#333333')
+        self.mem_ax.set_xlim(0, max(self.history_window - 1, 1))
+        self.mem_line, = self.mem_ax.plot([], [], color='#00CC99', linewidth=2)
+        self.mem_fill = self.mem_ax.add_collection(PolyCollection([], color='#90EE90', alpha=0.5))
+        self.mem_blit = BlitManager(self.mem_canvas, [self.mem_line, self.mem_fill])
+        return self.mem_canvas, self.update_mem_chart
+
+    def create_net_chart(self):
+        self.net_canvas, self.net_ax = self.new_chart(self.net_chart_frame)
         self.net_ax.set_ylabel('速度 (KB/s)', color='white')
-        for ax in [self.cpu_ax1, self.cpu_ax2, self.mem_ax, self.net_ax]:
-            ax.tick_params(colors='white')
-            for spine in ax.spines.values():
-                spine.set_color('white')
-            ax.xaxis.label.set_color('white')
-            ax.yaxis.label.set_color('white')
-        self.cpu_canvas.draw()
-        self.mem_canvas.draw()
-        self.net_canvas.draw()
+        self.net_ax.set_title('网络传输趋势', color='white', pad=20)
+        self.net_ax.set_xlim(0, max(self.history_window - 1, 1))
+        self.net_chart = SpeedChart(self.net_canvas, self.net_ax, ('上传', '下载'))
+        return self.net_canvas, self.update_net_chart
+
+    def create_disk_chart(self):
+        self.disk_canvas, self.disk_ax = self.new_chart(self.disk_chart_frame, figsize=(10, 3))
+        self.disk_ax.set_ylabel('速度 (KB/s)', color='white')
+        self.disk_ax.set_xlim(0, max(self.history_window - 1, 1))
+        self.disk_chart = SpeedChart(self.disk_canvas, self.disk_ax, ('读取', '写入'))
+        return self.disk_canvas, self.update_disk_chart
+
+    def reset_charts(self):
+        # 切换服务器后按新数据重新确定核心数、内存总量和纵轴范围
+        if self.cpu_bars is not None:
+            self.cpu_bars.remove()
+            self.cpu_bars = None
+            self.cpu_blit.set_artists([self.cpu_line, self.cpu_fill])
+        self.mem_total = None
+        for chart in (self.net_chart, self.disk_chart):
+            if chart is not None:
+                chart.reset()
+        self.shown_processes = None
+        self.shown_disk = None
 
     def load_config(self):
         if os.path.exists(self.CONFIG_FILE):
             self.config.read(self.CONFIG_FILE)
             self.server_host = self.config.get('SERVER', 'host', fallback="localhost")
             self.server_port = self.config.getint('SERVER', 'port', fallback=5021)
+            self.protocol = self.config.get('SERVER', 'protocol', fallback="binary")
+            self.delta = self.config.getboolean('SERVER', 'delta', fallback=True)
+            self.sample_interval = self.config.getfloat('SERVER', 'interval', fallback=1.0)
+            self.history_capacity = self.config.getint('HISTORY', 'capacity', fallback=86400)
+            self.history_window = self.config.getint('HISTORY', 'window', fallback=60)
+            self.fleet_hosts = parse_hosts(self.config.get('FLEET', 'hosts', fallback=""), self.server_port)
+            self.fleet_capacity = self.config.getint('FLEET', 'capacity', fallback=3600)
+            self.net_interface = self.config.get('NETWORK', 'interface', fallback="")
         else:
             self.server_host = "localhost"
             self.server_port = 5021
+            self.protocol = "binary"
+            self.delta = True
+            self.sample_interval = 1.0
+            self.history_capacity = 86400
+            self.history_window = 60
+            self.fleet_hosts = []
+            self.fleet_capacity = 3600
+            self.net_interface = ""
 
     def save_config(self):
         self.config['SERVER'] = {
             'host': self.server_host,
-            'port': str(self.server_port)
+            'port': str(self.server_port),
+            'protocol': self.protocol,
+            'delta': str(self.delta).lower(),
+            'interval': str(self.sample_interval)
+        }
+        self.config['FLEET'] = {
+            'hosts': format_hosts(self.fleet_hosts),
+            'capacity': str(self.fleet_capacity)
+        }
+        self.config['NETWORK'] = {
+            'interface': self.net_interface
         }
         with open(self.CONFIG_FILE, 'w') as f:
             self.config.write(f)
@@ -125,7 +461,7 @@ class ServerMonitorApp:
         )
         self.title_label.pack(pady=30)
         self.buttons = {}
-        for i, (text, page) in enumerate([("CPU", "cpu"), ("内存", "memory"), ("网络", "network"), ("设置", "settings")], 1):
+        for i, (text, page) in enumerate([("总览", "fleet"), ("CPU", "cpu"), ("内存", "memory"), ("网络", "network"), ("磁盘", "disk"), ("进程", "processes"), ("设置", "settings")], 1):
             btn_frame = tk.Frame(self.nav_frame, bg='#333333')
             btn_frame.pack(pady=15)
             self.buttons[page] = {
@@ -173,18 +509,29 @@ class ServerMonitorApp:
             btn['indicator'].config(bg='#333333')
         self.buttons[page]['button'].config(bg='#0099FF')
         titles = {
+            "fleet": "总览",
             "cpu": "CPU",
             "memory": "内存",
             "network": "网络",
+            "disk": "磁盘",
+            "processes": "进程",
             "settings": "设置"
         }
-        self.page_title.config(text=titles[page])
+        if self.fleet_mode and page in ("cpu", "memory", "network", "disk", "processes"):
+            self.page_title.config(text=f"{titles[page]} - {self.selected.name}")
+        else:
+            self.page_title.config(text=titles[page])
 
         for widget in self.page_container.winfo_children():
             widget.pack_forget()
 
         target_page = None
-        if page == "cpu":
+        if page == "fleet":
+            target_page = self.fleet_page
+            self.is_cpu_current = False
+            self.is_memory_current = False
+            self.is_network_current = False
+        elif page == "cpu":
             target_page = self.cpu_page
             self.is_cpu_current = True
             self.is_memory_current = False
@@ -199,6 +546,18 @@ class ServerMonitorApp:
             self.is_cpu_current = False
             self.is_memory_current = False
             self.is_network_current = True
+        elif page == "disk":
+            target_page = self.disk_page
+            self.is_cpu_current = False
+            self.is_memory_current = False
+            self.is_network_current = False
+            self.shown_disk = None
+        elif page == "processes":
+            target_page = self.process_page
+            self.is_cpu_current = False
+            self.is_memory_current = False
+            self.is_network_current = False
+            self.shown_processes = None
         elif page == "settings":
             target_page = self.settings_page
             self.is_cpu_current = False
@@ -211,13 +570,43 @@ class ServerMonitorApp:
             self.fade_in(target_page)
 
         self.current_page = page
+        self.send_subscription()
+        self.schedule_charts()
 
-        if page == "cpu" and hasattr(self, 'ani_cpu'):
-            self.ani_cpu.event_source.start()
-        elif page == "memory" and hasattr(self, 'ani_mem'):
-            self.ani_mem.event_source.start()
-        elif page == "network" and hasattr(self, 'ani_net'):
-            self.ani_net.event_source.start()
+    def schedule_charts(self):
+        if self.current_page in self.chart_builders and self.current_page not in self.chart_timers:
+            # 先让页面的其余部分显示出来, 事件循环空闲时再创建图表
+            self.root.after_idle(self.create_chart, self.current_page)
+        # 只有当前可见页面的图表定时刷新, 切换进来时先用已缓存的历史数据重绘一次
+        for page, (timer, update) in self.chart_timers.items():
+            if page == self.current_page:
+                update()
+                timer.start()
+            else:
+                timer.stop()
+        if self.fleet_job is not None:
+            self.root.after_cancel(self.fleet_job)
+            self.fleet_job = None
+        if self.current_page == "fleet":
+            self.update_fleet()
+
+    def update_fleet_nav(self):
+        # 总览按钮只在配置了集群主机时显示
+        frame = self.buttons['fleet']['frame']
+        if self.fleet_mode:
+            frame.pack(pady=15, before=self.buttons['cpu']['frame'])
+        else:
+            frame.pack_forget()
+
+    def select_host(self, state):
+        # 从总览进入某台服务器的详细页面, 原来选中的服务器改回概览订阅
+        previous = self.selected
+        self.selected = state
+        if previous is not state and self.manager is not None:
+            self.send_subscription(previous)
+            self.reset_charts()
+        self.shown_status = None
+        self.show_page("cpu")
 
     def fade_in(self, widget, count=0):
         max_count = 10
@@ -225,6 +614,80 @@ class ServerMonitorApp:
             widget.lift()
             self.root.after(50, self.fade_in, widget, count + 1)
 
+    def create_fleet_page(self):
+        self.fleet_page = tk.Frame(self.page_container, bg='#222222')
+        self.fleet_grid = tk.Frame(self.fleet_page, bg='#222222')
+        self.fleet_grid.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        self.fleet_tiles = []
+        self.build_fleet_tiles()
+
+    def build_fleet_tiles(self):
+        # 每台服务器一张卡片: 地址、概要数据和 CPU/内存迷你折线图, 点击进入详细页面
+        for widget in self.fleet_grid.winfo_children():
+            widget.destroy()
+        self.fleet_tiles = []
+        columns = 4
+        for i, state in enumerate(self.hosts):
+            tile = tk.Frame(self.fleet_grid, bg='#333333', bd=2, relief=tk.GROOVE, cursor='hand2')
+            tile.grid(row=i // columns, column=i % columns, padx=5, pady=5, sticky=tk.NSEW)
+            name = tk.Label(tile, text=state.name, bg='#333333', fg='white', font=self.font, anchor=tk.W)
+            name.pack(fill=tk.X, padx=5)
+            summary_var = tk.StringVar()
+            summary = tk.Label(tile, textvariable=summary_var, bg='#333333', fg='white', font=self.font, anchor=tk.W)
+            summary.pack(fill=tk.X, padx=5)
+            spark = tk.Canvas(tile, width=SPARK_WIDTH, height=SPARK_HEIGHT, bg='#222222', highlightthickness=0)
+            spark.pack(padx=5, pady=5)
+            for widget in (tile, name, summary, spark):
+                widget.bind('<Button-1>', lambda event, s=state: self.select_host(s))
+            self.fleet_tiles.append({
+                'state': state,
+                'name': name,
+                'color': 'white',
+                'summary': summary_var,
+                'spark': spark,
+                'cpu_line': spark.create_line(0, 0, 0, 0, fill='#0099FF'),
+                'mem_line': spark.create_line(0, 0, 0, 0, fill='#00CC99')
+            })
+        for column in range(columns):
+            self.fleet_grid.columnconfigure(column, weight=1)
+
+    def update_fleet(self):
+        # 总览页面用 Tk 画布直接更新折线坐标, 不为每台服务器创建 matplotlib 图表
+        if not self.running or self.current_page != "fleet":
+            return
+        for tile in self.fleet_tiles:
+            state = tile['state']
+            cpu_data = state.data['cpu']
+            mem_data = state.data['memory']
+            net_data = state.data['network']
+            if state.connected:
+                upload_value, upload_unit = convert_speed(net_data.get('upload_speed'))
+                download_value, download_unit = convert_speed(net_data.get('download_speed'))
+                tile['summary'].set(
+                    f"CPU {cpu_data['percent']:.1f}%  内存 {mem_data['percent']:.1f}%  "
+                    f"↑{upload_value} {upload_unit}  ↓{download_value} {download_unit}"
+                )
+                usage = max(cpu_data['percent'], mem_data['percent'])
+                color = '#FF0000' if usage >= 80 else '#FFA500' if usage >= 60 else 'white'
+            else:
+                tile['summary'].set(state.status)
+                color = '#888888'
+            if color != tile['color']:
+                tile['color'] = color
+                tile['name'].config(fg=color)
+
+            spark = tile['spark']
+            for item, values, top in (
+                (tile['cpu_line'], state.history['cpu'].view(self.history_window), 100),
+                (tile['mem_line'], state.history['memory'].view(self.history_window), mem_data['total'] / (1024**3))
+            ):
+                coords = spark_coords(values, top, self.history_window)
+                if coords is None:
+                    spark.coords(item, 0, 0, 0, 0)
+                else:
+                    spark.coords(item, coords)
+        self.fleet_job = self.root.after(self.refresh_interval(), self.update_fleet)
+
     def create_cpu_page(self):
         self.cpu_page = tk.Frame(self.page_container, bg='#222222')
         top_frame = tk.Frame(self.cpu_page, bg='#222222')
@@ -283,13 +746,7 @@ class ServerMonitorApp:
             relief=tk.GROOVE
         )
         chart_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
-        plt.rcParams['font.family'] = 'Microsoft YaHei'
-        self.cpu_fig, (self.cpu_ax1, self.cpu_ax2) = plt.subplots(2, 1, figsize=(10, 6), facecolor='#333333', gridspec_kw={'height_ratios': [1, 2]})
-        self.cpu_ax1.set_facecolor('#333333')
-        self.cpu_ax2.set_facecolor('#333333')
-        
-        self.cpu_canvas = FigureCanvasTkAgg(self.cpu_fig, master=chart_frame)
-        self.cpu_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.cpu_chart_frame = chart_frame
     
     def create_memory_page(self):
         self.memory_page = tk.Frame(self.page_container, bg='#222222')
@@ -371,10 +828,7 @@ class ServerMonitorApp:
             relief=tk.GROOVE
         )
         chart_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
-        self.mem_fig, self.mem_ax = plt.subplots(figsize=(10, 5), facecolor='#333333')
-        
-        self.mem_canvas = FigureCanvasTkAgg(self.mem_fig, master=chart_frame)
-        self.mem_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.mem_chart_frame = chart_frame
 
     def create_network_page(self):
         self.network_page = tk.Frame(self.page_container, bg='#222222')
@@ -427,6 +881,25 @@ class ServerMonitorApp:
             fg='white',
             font=self.font
         ).grid(row=1, column=1, sticky=tk.W, padx=5, pady=2)
+
+        tk.Label(
+            info_frame,
+            text="网卡:",
+            bg='#333333',
+            fg='white',
+            font=self.font
+        ).grid(row=2, column=0, sticky=tk.W, padx=5, pady=2)
+        self.interface_var = tk.StringVar(value=self.net_interface or "全部")
+        self.interface_box = ttk.Combobox(
+            info_frame,
+            textvariable=self.interface_var,
+            values=["全部"],
+            state='readonly',
+            width=20
+        )
+        self.interface_box.grid(row=2, column=1, sticky=tk.W, padx=5, pady=2)
+        self.interface_box.bind('<<ComboboxSelected>>', self.select_interface)
+        self.shown_interfaces = None
         
         chart_frame = tk.LabelFrame(
             self.network_page, 
@@ -440,12 +913,282 @@ class ServerMonitorApp:
             relief=tk.GROOVE
         )
         chart_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
-        self.net_fig, self.net_ax = plt.subplots(figsize=(10, 5), facecolor='#333333')
-        self.net_ax.set_facecolor('#333333')
-        
-        self.net_canvas = FigureCanvasTkAgg(self.net_fig, master=chart_frame)
-        self.net_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.net_chart_frame = chart_frame
     
+    def select_interface(self, event=None):
+        value = self.interface_var.get()
+        self.net_interface = "" if value == "全部" else value
+        self.save_config()
+        if self.net_chart is not None:
+            self.net_chart.reset()
+            self.update_net_chart()
+
+    def update_interface_list(self):
+        names = sorted(self.data.get('interfaces', {}))
+        if names != self.shown_interfaces:
+            self.shown_interfaces = names
+            self.interface_box.config(values=["全部", *names])
+
+    def selected_network(self):
+        # 选中的网卡在当前服务器上不存在时显示全部网卡的总量
+        nic = self.data.get('interfaces', {}).get(self.net_interface) if self.net_interface else None
+        if nic is None:
+            return self.data['network'], self.history['network']
+        return nic, self.selected.interface_history(self.net_interface)
+
+    def create_disk_page(self):
+        self.disk_page = tk.Frame(self.page_container, bg='#222222')
+
+        top_frame = tk.Frame(self.disk_page, bg='#222222')
+        top_frame.pack(fill=tk.X, padx=20, pady=10)
+
+        info_frame = tk.LabelFrame(
+            top_frame,
+            text="磁盘读写",
+            bg='#333333',
+            fg='white',
+            font=self.font,
+            padx=10,
+            pady=10,
+            bd=2,
+            relief=tk.GROOVE
+        )
+        info_frame.pack(side=tk.LEFT, fill=tk.BOTH)
+
+        self.disk_read_var = tk.StringVar()
+        self.disk_write_var = tk.StringVar()
+        self.disk_ops_var = tk.StringVar()
+        for row, (text, var) in enumerate((
+            ("读取速度:", self.disk_read_var),
+            ("写入速度:", self.disk_write_var),
+            ("读/写 IOPS:", self.disk_ops_var)
+        )):
+            tk.Label(
+                info_frame,
+                text=text,
+                bg='#333333',
+                fg='white',
+                font=self.font
+            ).grid(row=row, column=0, sticky=tk.W, padx=5, pady=2)
+            tk.Label(
+                info_frame,
+                textvariable=var,
+                bg='#333333',
+                fg='white',
+                font=self.font
+            ).grid(row=row, column=1, sticky=tk.W, padx=5, pady=2)
+
+        device_frame = tk.LabelFrame(
+            top_frame,
+            text="磁盘设备",
+            bg='#333333',
+            fg='white',
+            font=self.font,
+            padx=10,
+            pady=10,
+            bd=2,
+            relief=tk.GROOVE
+        )
+        device_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(10, 0))
+        self.disk_tree = self.create_table(
+            device_frame,
+            (
+                ('device', "设备", 100, tk.W),
+                ('read', "读取", 100, tk.E),
+                ('write', "写入", 100, tk.E),
+                ('ops', "读/写 IOPS", 110, tk.E),
+                ('busy', "繁忙度", 80, tk.E)
+            ),
+            height=4
+        )
+        self.disk_tree.pack(fill=tk.BOTH, expand=True)
+
+        mount_frame = tk.LabelFrame(
+            self.disk_page,
+            text="文件系统",
+            bg='#333333',
+            fg='white',
+            font=self.font,
+            padx=10,
+            pady=10,
+            bd=2,
+            relief=tk.GROOVE
+        )
+        mount_frame.pack(fill=tk.X, padx=20, pady=10)
+        self.mount_tree = self.create_table(
+            mount_frame,
+            (
+                ('mount', "挂载点", 240, tk.W),
+                ('device', "设备", 160, tk.W),
+                ('fstype', "类型", 80, tk.W),
+                ('used', "已用", 100, tk.E),
+                ('total', "总量", 100, tk.E),
+                ('percent', "使用率", 80, tk.E)
+            ),
+            height=4
+        )
+        self.mount_tree.pack(fill=tk.BOTH, expand=True)
+
+        chart_frame = tk.LabelFrame(
+            self.disk_page,
+            text="磁盘读写趋势",
+            bg='#333333',
+            fg='white',
+            font=self.font,
+            padx=10,
+            pady=10,
+            bd=2,
+            relief=tk.GROOVE
+        )
+        chart_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        self.disk_chart_frame = chart_frame
+
+    def update_disk_tables(self):
+        # 只在收到新的磁盘数据时重建表格
+        disk = self.data.get('disk')
+        if disk is None or disk is self.shown_disk:
+            return
+        self.shown_disk = disk
+        read_value, read_unit = convert_speed(disk.get('read_speed', 0) / 1024)
+        write_value, write_unit = convert_speed(disk.get('write_speed', 0) / 1024)
+        self.disk_read_var.set(f"{read_value} {read_unit}")
+        self.disk_write_var.set(f"{write_value} {write_unit}")
+        self.disk_ops_var.set(f"{disk.get('read_ops', 0):.0f} / {disk.get('write_ops', 0):.0f}")
+
+        self.disk_tree.delete(*self.disk_tree.get_children())
+        for name, device in sorted(disk.get('devices', {}).items()):
+            read_value, read_unit = convert_speed(device['read_speed'] / 1024)
+            write_value, write_unit = convert_speed(device['write_speed'] / 1024)
+            busy = device.get('busy')
+            self.disk_tree.insert('', tk.END, values=(
+                name,
+                f"{read_value} {read_unit}",
+                f"{write_value} {write_unit}",
+                f"{device['read_ops']:.0f} / {device['write_ops']:.0f}",
+                f"{busy:.1f}%" if busy is not None else "N/A"
+            ))
+
+        self.mount_tree.delete(*self.mount_tree.get_children())
+        for mount in disk.get('mounts', []):
+            self.mount_tree.insert('', tk.END, values=(
+                mount['mount'],
+                mount['device'],
+                mount['fstype'],
+                format_bytes(mount['used']),
+                format_bytes(mount['total']),
+                f"{mount['percent']:.1f}%"
+            ))
+
+    def create_process_page(self):
+        self.process_page = tk.Frame(self.page_container, bg='#222222')
+
+        top_frame = tk.Frame(self.process_page, bg='#222222')
+        top_frame.pack(fill=tk.X, padx=20, pady=10)
+
+        info_frame = tk.LabelFrame(
+            top_frame,
+            text="进程概况",
+            bg='#333333',
+            fg='white',
+            font=self.font,
+            padx=10,
+            pady=10,
+            bd=2,
+            relief=tk.GROOVE
+        )
+        info_frame.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        self.process_count_var = tk.StringVar()
+        tk.Label(
+            info_frame,
+            text="进程总数:",
+            bg='#333333',
+            fg='white',
+            font=self.font
+        ).grid(row=0, column=0, sticky=tk.W, padx=5, pady=2)
+        tk.Label(
+            info_frame,
+            textvariable=self.process_count_var,
+            bg='#333333',
+            fg='white',
+            font=self.font
+        ).grid(row=0, column=1, sticky=tk.W, padx=5, pady=2)
+
+        table_frame = tk.LabelFrame(
+            self.process_page,
+            text="占用最高的进程",
+            bg='#333333',
+            fg='white',
+            font=self.font,
+            padx=10,
+            pady=10,
+            bd=2,
+            relief=tk.GROOVE
+        )
+        table_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+
+        # 点击 CPU 或内存列标题切换排序方式
+        self.process_tree = self.create_table(
+            table_frame,
+            (
+                ('pid', "PID", 80, tk.E),
+                ('name', "名称", 260, tk.W),
+                ('user', "用户", 140, tk.W),
+                ('cpu', "CPU (%)", 100, tk.E),
+                ('rss', "内存", 120, tk.E)
+            ),
+            sortable={'cpu', 'rss'},
+            command=self.sort_processes
+        )
+        self.process_tree.pack(fill=tk.BOTH, expand=True)
+
+    def create_table(self, parent, columns, height=10, sortable=(), command=None):
+        # 进程和磁盘页面共用的深色表格, columns 为 (列名, 标题, 宽度, 对齐方式)
+        style = ttk.Style(self.root)
+        style.configure(
+            'Monitor.Treeview',
+            background='#333333',
+            fieldbackground='#333333',
+            foreground='white',
+            font=self.font,
+            rowheight=24
+        )
+        style.configure('Monitor.Treeview.Heading', background='#444444', foreground='white', font=self.font)
+        tree = ttk.Treeview(
+            parent,
+            columns=[column for column, _, _, _ in columns],
+            show='headings',
+            height=height,
+            style='Monitor.Treeview'
+        )
+        for column, text, width, anchor in columns:
+            tree.heading(column, text=text, command=(lambda c=column: command(c)) if column in sortable else '')
+            tree.column(column, width=width, anchor=anchor)
+        return tree
+
+    def sort_processes(self, column):
+        self.process_sort = column
+        self.shown_processes = None
+        self.update_process_table()
+
+    def update_process_table(self):
+        # 只在收到新的进程列表时重建表格
+        processes = self.data.get('processes')
+        if processes is None or processes is self.shown_processes:
+            return
+        self.shown_processes = processes
+        self.process_count_var.set(str(processes.get('count', 0)))
+        rows = sorted(processes.get('top', []), key=lambda row: row[self.process_sort], reverse=True)
+        self.process_tree.delete(*self.process_tree.get_children())
+        for row in rows:
+            self.process_tree.insert('', tk.END, values=(
+                row['pid'],
+                row['name'],
+                row['user'],
+                f"{row['cpu']:.1f}",
+                format_bytes(row['rss'])
+            ))
+
     def create_settings_page(self):
         self.settings_page = tk.Frame(self.page_container, bg='#222222')
         
@@ -488,6 +1231,32 @@ class ServerMonitorApp:
         self.port_entry.insert(0, str(self.server_port))
         self.port_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
         
+        interval_frame = tk.Frame(form_frame, bg='#333333')
+        interval_frame.pack(fill=tk.X, pady=5)
+        tk.Label(
+            interval_frame, 
+            text="采样间隔(秒):", 
+            bg='#333333', 
+            fg='white',
+            font=self.font
+        ).pack(side=tk.LEFT, padx=(5, 10))
+        self.interval_entry = tk.Entry(interval_frame, bg='#555555', fg='white', insertbackground='white')
+        self.interval_entry.insert(0, str(self.sample_interval))
+        self.interval_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        fleet_frame = tk.Frame(form_frame, bg='#333333')
+        fleet_frame.pack(fill=tk.X, pady=5)
+        tk.Label(
+            fleet_frame, 
+            text="集群主机:", 
+            bg='#333333', 
+            fg='white',
+            font=self.font
+        ).pack(side=tk.LEFT, padx=(5, 10))
+        self.fleet_entry = tk.Entry(fleet_frame, bg='#555555', fg='white', insertbackground='white')
+        self.fleet_entry.insert(0, format_hosts(self.fleet_hosts))
+        self.fleet_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
         btn_frame = tk.Frame(form_frame, bg='#333333')
         btn_frame.pack(fill=tk.X, pady=(10, 0))
         
@@ -515,20 +1284,23 @@ class ServerMonitorApp:
         try:
             self.server_host = self.host_entry.get()
             self.server_port = int(self.port_entry.get())
+            self.sample_interval = float(self.interval_entry.get())
+            self.fleet_hosts = parse_hosts(self.fleet_entry.get(), self.server_port)
             self.save_config()
             self.status_var.set("设置已保存")
+            for timer, _ in self.chart_timers.values():
+                timer.interval = self.refresh_interval()
             
-            if self.thread.is_alive():
-                self.running = False
-                self.thread.join(timeout=1)
-            
-            self.running = True
-            self.thread = threading.Thread(target=self.update_data)
-            self.thread.daemon = True
-            self.thread.start()
+            self.stop_connections()
+            if [(state.host, state.port, state.source) for state in self.hosts] != self.configured_hosts():
+                self.create_hosts()
+                self.reset_charts()
+                self.build_fleet_tiles()
+                self.update_fleet_nav()
+            self.start_connections()
             
         except ValueError:
-            self.status_var.set("错误: 端口必须是数字")
+            self.status_var.set("错误: 端口和采样间隔必须是数字")
     
     def test_connection(self):
         try:
@@ -542,207 +1314,126 @@ class ServerMonitorApp:
         except Exception as e:
             self.status_var.set(f"连接测试失败: {str(e)}")
     
-    def update_data(self):
-        last_update_time = None
-        last_bytes_sent = 0
-        last_bytes_recv = 0
-        
-        while self.running:
-            try:
-                ip = socket.gethostbyname(self.server_host)
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.connect((ip, self.server_port))
-                    self.status_var.set(f"已连接到 {self.server_host} ({ip}):{self.server_port}")
-                    
-                    buffer = b''
-                    while self.running:
-                        data = s.recv(4096)
-                        if not data:
-                            break
-                            
-                        buffer += data
-                        while b'\n' in buffer:
-                            line, buffer = buffer.split(b'\n', 1)
-                            current_time = time.perf_counter()
-                            new_data = json.loads(line.decode('utf-8'))
-                            
-                            current_bytes_sent = new_data['network']['bytes_sent']
-                            current_bytes_recv = new_data['network']['bytes_recv']
-                            
-                            if last_update_time is None:
-                                last_update_time = current_time
-                                last_bytes_sent = current_bytes_sent
-                                last_bytes_recv = current_bytes_recv
-                                continue
-                            
-                            time_elapsed = current_time - last_update_time
-                            
-                            max_counter = 2**32
-                            if current_bytes_sent < last_bytes_sent:
-                                sent_diff = (max_counter - last_bytes_sent) + current_bytes_sent
-                            else:
-                                sent_diff = current_bytes_sent - last_bytes_sent
-                            if current_bytes_recv < last_bytes_recv:
-                                recv_diff = (max_counter - last_bytes_recv) + current_bytes_recv
-                            else:
-                                recv_diff = current_bytes_recv - last_bytes_recv
-                            
-                            if time_elapsed >= 0.1:
-                                upload_speed = (sent_diff / 1024) / time_elapsed
-                                download_speed = (recv_diff / 1024) / time_elapsed
-                                
-                                max_speed = 1024 * 1024
-                                upload_speed = min(upload_speed, max_speed)
-                                download_speed = min(download_speed, max_speed)
-                                
-                                new_data['network']['upload_speed'] = upload_speed
-                                new_data['network']['download_speed'] = download_speed
-                        
-                            last_update_time = current_time
-                            last_bytes_sent = current_bytes_sent
-                            last_bytes_recv = current_bytes_recv
-                            
-                            self.data = new_data
-                            self.update_history_data(new_data)
-                            
-            except (ConnectionRefusedError, ConnectionResetError) as e:
-                self.status_var.set(f"连接错误: {str(e)}. 5秒后重试...")
-                time.sleep(5)
-            except Exception as e:
-                self.status_var.set(f"错误: {str(e)}")
-            time.sleep(0.5)
+    def subscription(self, state=None):
+        # 总览页面和未选中的服务器只订阅卡片上显示的概要数据
+        if (state is not None and state is not self.selected) or self.current_page == 'fleet':
+            return {'groups': ['cpu', 'memory', 'network'], 'per_cpu': False}
+        # 导航栏指示灯需要 CPU 和内存占用率, 其余数据只在对应页面可见时订阅
+        groups = ['cpu', 'memory']
+        if self.current_page == 'network':
+            groups += ['network', 'interfaces']
+        elif self.current_page == 'disk':
+            groups.append('disk')
+        elif self.current_page == 'processes':
+            groups.append('processes')
+        return {'groups': groups, 'per_cpu': self.current_page == 'cpu'}
 
-    def update_history_data(self, new_data):
-        self.history['cpu'].append(new_data['cpu']['percent'])
-        if len(self.history['cpu']) > 60:
-            self.history['cpu'].pop(0)
-        
-        self.history['memory'].append(new_data['memory']['used'] / (1024**3))
-        if len(self.history['memory']) > 60:
-            self.history['memory'].pop(0)
-        
-        if 'upload_speed' in new_data['network']:
-            self.history['network']['upload'].append(new_data['network']['upload_speed'])
-            self.history['network']['download'].append(new_data['network']['download_speed'])
-            if len(self.history['network']['upload']) > 60:
-                self.history['network']['upload'].pop(0)
-            if len(self.history['network']['download']) > 60:
-                self.history['network']['download'].pop(0)
-                    
-    def update_mem_chart(self, i):
+    def refresh_interval(self):
+        # 界面刷新频率跟随采样间隔, 每个采样周期刷新两次
+        return max(50, int(self.sample_interval * 500))
+
+    def send_subscription(self, state=None):
+        # 很多页面订阅的分组相同, 切换页面时只在订阅变化时通知服务端
+        state = state or self.selected
+        subscription = self.subscription(state)
+        if self.manager is not None and subscription != state.subscribed:
+            state.subscribed = subscription
+            self.manager.send(state, dict(subscription, type='subscribe'))
+
+    def hello(self, state):
+        state.subscribed = self.subscription(state)
+        message = dict(
+            state.subscribed,
+            type='hello',
+            version=PROTOCOL_VERSION,
+            format=self.protocol,
+            delta=self.delta,
+            interval=self.sample_interval
+        )
+        if state.source:
+            message['source'] = state.source
+        return json.dumps(message).encode('utf-8') + b'\n'
+
+    def history_query(self, state):
+        # 首次连接时向服务端查询最近一个图表窗口的历史, 不必等待数据逐个到达
+        if len(state.history['cpu']):
+            return None
+        return json.dumps({
+            'type': 'query',
+            'id': 'history',
+            'metric': ['cpu.percent', 'memory.used', 'network.upload_speed', 'network.download_speed'],
+            'seconds': self.history_window * self.sample_interval,
+            'points': self.history_window
+        }).encode('utf-8') + b'\n'
+
+    def update_mem_chart(self):
         if not self.running:
-            return []
-        artists = []
+            return
         mem_data = self.data['memory']
-        self.mem_ax.clear()
-        if self.history['memory']:
-            line2, = self.mem_ax.plot(self.history['memory'], color='#00CC99', linewidth=2)
-            self.mem_ax.set_ylabel('内存 (GB)', color='white')
-            self.mem_ax.set_xlabel('时间', color='white')
-            self.mem_ax.tick_params(colors='white')
-            for spine in self.mem_ax.spines.values():
-                spine.set_color('white')
-            artists.append(line2)
-            fill = self.mem_ax.fill_between(range(len(self.history['memory'])), self.history['memory'], color='#90EE90', alpha=0.5)
-            artists.append(fill)
-            total_memory_gb = mem_data['total'] / (1024 ** 3)
-            self.mem_ax.set_ylim(0, total_memory_gb * 1.1)
+        redraw = False
+        if mem_data['total'] and mem_data['total'] != self.mem_total:
+            self.mem_total = mem_data['total']
+            self.mem_ax.set_ylim(0, self.mem_total / (1024 ** 3) * 1.1)
+            redraw = True
+
+        memory_history = self.history['memory'].view(self.history_window)
+        self.mem_line.set_data(np.arange(len(memory_history)), memory_history)
+        self.mem_fill.set_verts(fill_verts(memory_history))
         if self.is_memory_current:
-            self.mem_canvas.draw()
-        return artists
+            self.mem_blit.update(redraw)
 
-    def update_cpu_chart(self, i):
+    def update_cpu_chart(self):
         if not self.running:
-            return []
-        artists = []
+            return
         cpu_data = self.data['cpu']
-        self.cpu_ax1.clear()
-        self.cpu_ax2.clear()
-        if cpu_data['per_cpu']:
-            cores = len(cpu_data['per_cpu'])
-            self.cpu_ax2.bar(range(cores), cpu_data['per_cpu'], color='#0099FF')
+        per_cpu = cpu_data.get('per_cpu') or []
+        redraw = False
+        if per_cpu and (self.cpu_bars is None or len(self.cpu_bars) != len(per_cpu)):
+            # 核心数变化时才重建柱状图和刻度
+            if self.cpu_bars is not None:
+                self.cpu_bars.remove()
+            cores = len(per_cpu)
+            self.cpu_bars = self.cpu_ax2.bar(range(cores), per_cpu, color='#0099FF')
             self.cpu_ax2.set_xticks(range(cores))
             self.cpu_ax2.set_xticklabels([f"Core {i}" for i in range(cores)], color='white')
-            self.cpu_ax2.set_ylim(0, 100)
-            self.cpu_ax2.set_ylabel('使用率 (%)', color='white')
-            self.cpu_ax2.tick_params(colors='white')
-            for spine in self.cpu_ax2.spines.values():
-                spine.set_color('white')
-            artists.extend(self.cpu_ax2.patches)
-        if self.history['cpu']:
-            line1, = self.cpu_ax1.plot(self.history['cpu'], color='#0099FF', linewidth=2)
-            self.cpu_ax1.set_ylim(0, 100)
-            self.cpu_ax1.set_ylabel('总使用率 (%)', color='white')
-            self.cpu_ax1.tick_params(colors='white')
-            for spine in self.cpu_ax1.spines.values():
-                spine.set_color('white')
-            artists.append(line1)
-            fill = self.cpu_ax1.fill_between(range(len(self.history['cpu'])), self.history['cpu'], color='#87CEFA', alpha=0.5)
-            artists.append(fill)
+            self.cpu_ax2.set_xlim(-0.5, cores - 0.5)
+            self.cpu_blit.set_artists([self.cpu_line, self.cpu_fill, *self.cpu_bars])
+            redraw = True
+        if self.cpu_bars is not None:
+            for bar, usage in zip(self.cpu_bars, per_cpu):
+                bar.set_height(usage)
+
+        cpu_history = self.history['cpu'].view(self.history_window)
+        self.cpu_line.set_data(np.arange(len(cpu_history)), cpu_history)
+        self.cpu_fill.set_verts(fill_verts(cpu_history))
         if self.is_cpu_current:
-            self.cpu_canvas.draw()
-        return artists
+            self.cpu_blit.update(redraw)
 
-    def update_net_chart(self, i):
+    def update_net_chart(self):
         if not self.running:
-            return []
-    
-        artists = []
-        net_data = self.data['network']
-        
-        self.net_ax.clear()
-        
-        upload = net_data.get('upload_speed', 0)
-        download = net_data.get('download_speed', 0)
-    
-        upload_history = self.history['network'].get('upload', [])
-        download_history = self.history['network'].get('download', [])
-        
-        max_value = max(max(upload_history or [0]), max(download_history or [0]), upload, download)
-        min_value = min(min(upload_history or [0]), min(download_history or [0]), upload, download) if upload_history and download_history else 0
-        
-        if max_value >= 1024 * 1024:
-            unit = 'GB/s'
-            upload /= 1024 * 1024
-            download /= 1024 * 1024
-            upload_history = [x/(1024 * 1024) for x in upload_history]
-            download_history = [x/(1024 * 1024) for x in download_history]
-        elif max_value >= 1024:
-            unit = 'MB/s'
-            upload /= 1024
-            download /= 1024
-            upload_history = [x/1024 for x in upload_history]
-            download_history = [x/1024 for x in download_history]
-        elif min_value < 1 and max_value < 1024:
-            unit = 'B/s'
-            upload_history = [x for x in upload_history]
-            download_history = [x for x in download_history]
-        else:
-            unit = 'KB/s'
-            upload /= 1024 if max_value >= 1024 else 1
-            download /= 1024 if max_value >= 1024 else 1
-            upload_history = [x/1024 if max_value >= 1024 else x for x in upload_history]
-            download_history = [x/1024 if max_value >= 1024 else x for x in download_history]
-        
-        if upload_history and download_history:
-            line3, = self.net_ax.plot(upload_history, color='#0099FF', linewidth=2, label=f'上传 ({unit})')
-            line4, = self.net_ax.plot(download_history, color='#00CC99', linewidth=2, label=f'下载 ({unit})')
-            artists.extend([line3, line4])
-            fill_upload = self.net_ax.fill_between(range(len(upload_history)), upload_history, color='#87CEFA', alpha=0.5)
-            artists.append(fill_upload)
-            fill_download = self.net_ax.fill_between(range(len(download_history)), download_history, color='#90EE90', alpha=0.5)
-            artists.append(fill_download)
-        
-        self.net_ax.set_ylabel(f'速度 ({unit})', color='white')
-        self.net_ax.set_title('网络传输趋势', color='white', pad=20)
-        self.net_ax.tick_params(colors='white')
-        for spine in self.net_ax.spines.values():
-            spine.set_color('white')
-        
-        leg = self.net_ax.legend(facecolor='#333333', labelcolor='white')
-        artists.append(leg)
-        self.net_canvas.draw()
-        return artists
+            return
+        net_data, net_history = self.selected_network()
+        self.net_chart.update(
+            (
+                net_history['upload'].view(self.history_window),
+                net_history['download'].view(self.history_window)
+            ),
+            (net_data.get('upload_speed', 0), net_data.get('download_speed', 0)),
+            self.is_network_current
+        )
+
+    def update_disk_chart(self):
+        if not self.running:
+            return
+        disk_data = self.data['disk']
+        self.disk_chart.update(
+            (
+                self.history['disk']['read'].view(self.history_window),
+                self.history['disk']['write'].view(self.history_window)
+            ),
+            (disk_data.get('read_speed', 0) / 1024, disk_data.get('write_speed', 0) / 1024),
+            self.current_page == 'disk'
+        )
 
     def update_ui(self):
         if not self.running:
@@ -750,7 +1441,7 @@ class ServerMonitorApp:
 
         cpu_data = self.data['cpu']
         mem_data = self.data['memory']
-        net_data = self.data['network']
+        net_data, _ = self.selected_network()
 
         if cpu_data['percent'] is not None and cpu_data['percent'] >= 0:
             self.cpu_percent_var.set(f"{cpu_data['percent']:.1f}%")
@@ -777,16 +1468,6 @@ class ServerMonitorApp:
         else:
             self.mem_total_var.set("N/A")
 
-        def convert_speed(speed):
-            if speed is None or speed < 0:
-                return "N/A", ""
-            if speed >= 1024 * 1024:
-                return f"{speed / (1024 * 1024):.2f}", "GB/s"
-            elif speed >= 1024:
-                return f"{speed / 1024:.2f}", "MB/s"
-            else:
-                return f"{speed:.2f}", "KB/s"
-
         upload_speed = net_data.get('upload_speed')
         upload_value, upload_unit = convert_speed(upload_speed)
         self.upload_var.set(f"{upload_value} {upload_unit}")
@@ -809,23 +1490,46 @@ class ServerMonitorApp:
         else:
             self.buttons['memory']['indicator'].config(bg='#333333')
 
-        self.root.after(500, self.update_ui)
+        if self.current_page == "network":
+            self.update_interface_list()
+        elif self.current_page == "disk":
+            self.update_disk_tables()
+        elif self.current_page == "processes":
+            self.update_process_table()
+
+        if self.fleet_mode and self.current_page == "fleet":
+            online = sum(state.connected for state in self.hosts)
+            status = f"{online}/{len(self.hosts)} 台服务器在线"
+        else:
+            status = self.selected.status
+        if status != self.shown_status:
+            self.shown_status = status
+            self.status_var.set(status)
+
+        self.root.after(self.refresh_interval(), self.update_ui)
     
     def on_close(self):
         self.running = False
-        if hasattr(self, 'ani_cpu'):
-            self.ani_cpu.event_source.stop()
-        if hasattr(self, 'ani_mem'):
-            self.ani_mem.event_source.stop()
-        if hasattr(self, 'ani_net'):
-            self.ani_net.event_source.stop()
-        if hasattr(self, 'thread') and self.thread.is_alive():
-            self.thread.join(timeout=1)
-        plt.close('all')
+        for timer, _ in self.chart_timers.values():
+            timer.stop()
+        self.stop_connections()
+        if self.recorder is not None:
+            self.recorder.close()
         self.root.destroy()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="服务器性能监控客户端")
+    parser.add_argument('--record', default=None, metavar='FILE',
+                        help="把收到的原始数据追加录制到该文件")
+    parser.add_argument('--replay', default=None, metavar='FILE',
+                        help="回放录制文件 (客户端或服务端 --record 生成), 不连接服务器")
+    parser.add_argument('--speed', type=float, default=1,
+                        help="回放速度倍数, 如 1 或 10; 0 表示不等待, 以最快速度回放")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
     root = tk.Tk()
-    app = ServerMonitorApp(root)
+    app = ServerMonitorApp(root, args.record, args.replay, args.speed)
     root.protocol("WM_DELETE_WINDOW", app.on_close)
     root.mainloop()
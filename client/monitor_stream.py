@@ -0,0 +1,508 @@
+"""服务端数据流的解析和连接管理, 由图形客户端和命令行客户端共用, 只依赖标准库"""
+import json
+import struct
+import sys
+import threading
+import time
+from array import array
+
+PROTOCOL_VERSION = 2
+
+# 与服务端一致的二进制帧格式: 1 字节帧类型 + 4 字节负载长度
+FRAME_HEADER = struct.Struct('!BI')
+FRAME_STATS = 1
+FRAME_DELTA = 2
+FRAME_REPLY = 3
+
+STATS_FIELDS = (
+    (('timestamp',), 'd'),
+    (('interval',), 'f'),
+    (('cpu', 'percent'), 'f'),
+    (('cpu', 'freq'), 'f'),
+    (('memory', 'used'), 'Q'),
+    (('memory', 'total'), 'Q'),
+    (('memory', 'percent'), 'f'),
+    (('network', 'bytes_sent'), 'Q'),
+    (('network', 'bytes_recv'), 'Q'),
+    (('network', 'upload_speed'), 'd'),
+    (('network', 'download_speed'), 'd'),
+)
+# float32 字段在服务端已按这些小数位数取整, 解码后同样取整以去掉单精度的舍入误差
+FLOAT_DIGITS = {
+    ('interval',): 3,
+    ('cpu', 'percent'): 1,
+    ('cpu', 'freq'): 1,
+    ('memory', 'percent'): 1,
+}
+MASK = struct.Struct('!I')
+COUNT = struct.Struct('!H')
+LENGTH = struct.Struct('!I')
+PER_CPU_BIT = 1 << 31
+EXTRA_BIT = 1 << 30
+CORE_CHANGE = struct.Struct('!HH')
+
+# 录制文件 (与服务端 --record 格式相同): 文件头之后是追加写入的记录,
+# 每条记录为 1 字节类型 + 8 字节时间戳 + 2 字节数据流编号 + 4 字节长度 + 数据.
+# RECORD_STREAM 声明数据流名称, 同一数据流每次重新连接都会再次声明; RECORD_DATA 为收到的原始字节
+RECORD_MAGIC = b'SMREC1\n'
+RECORD_HEADER = struct.Struct('!BdHI')
+RECORD_STREAM = 1
+RECORD_DATA = 2
+
+_field_structs = {}
+
+def fields_struct(mask):
+    st = _field_structs.get(mask)
+    if st is None:
+        fields = [(path, code) for i, (path, code) in enumerate(STATS_FIELDS) if mask & (1 << i)]
+        st = _field_structs[mask] = (
+            struct.Struct('!' + ''.join(code for _, code in fields)),
+            [(path, FLOAT_DIGITS.get(path)) for path, _ in fields]
+        )
+    return st
+
+def merge_stats(target, update):
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_stats(target[key], value)
+        else:
+            target[key] = value
+
+def apply_delta(state, delta):
+    for key, value in delta.items():
+        if not (isinstance(value, dict) and isinstance(state.get(key), dict)):
+            state[key] = value
+            continue
+        group = state[key]
+        for k, v in value.items():
+            if k == 'per_cpu' and isinstance(v, dict):
+                per_cpu = group.setdefault('per_cpu', [])
+                for index, usage in v.items():
+                    index = int(index)
+                    if index >= len(per_cpu):
+                        per_cpu.extend([0] * (index + 1 - len(per_cpu)))
+                    per_cpu[index] = usage
+            else:
+                group[k] = v
+
+def copy_stats(stats):
+    copied = {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            value = dict(value)
+            if 'per_cpu' in value:
+                value['per_cpu'] = list(value['per_cpu'])
+        copied[key] = value
+    return copied
+
+def decode_stats(payload, frame_type=FRAME_STATS):
+    mask, = MASK.unpack_from(payload, 0)
+    offset = MASK.size
+    st, paths = fields_struct(mask)
+    stats = {}
+    for (path, digits), value in zip(paths, st.unpack_from(payload, offset)):
+        if digits is not None:
+            value = round(value, digits)
+        if len(path) == 1:
+            stats[path[0]] = value
+        else:
+            stats.setdefault(path[0], {})[path[1]] = value
+    offset += st.size
+
+    if mask & PER_CPU_BIT and frame_type == FRAME_DELTA:
+        count, = COUNT.unpack_from(payload, offset)
+        offset += COUNT.size
+        cores = {}
+        for _ in range(count):
+            index, usage = CORE_CHANGE.unpack_from(payload, offset)
+            cores[index] = usage / 100
+            offset += CORE_CHANGE.size
+        stats.setdefault('cpu', {})['per_cpu'] = cores
+    elif mask & PER_CPU_BIT:
+        count, = COUNT.unpack_from(payload, offset)
+        offset += COUNT.size
+        packed = array('H')
+        packed.frombytes(payload[offset:offset + count * 2])
+        if sys.byteorder == 'little':
+            packed.byteswap()
+        stats.setdefault('cpu', {})['per_cpu'] = [v / 100 for v in packed]
+        offset += count * 2
+    if mask & EXTRA_BIT:
+        length, = LENGTH.unpack_from(payload, offset)
+        offset += LENGTH.size
+        merge_stats(stats, json.loads(payload[offset:offset + length].decode('utf-8')))
+    return stats
+
+def parse_hosts(text, default_port=5021):
+    # "host1:5021, web1:5021@relay:5020" -> [('host1', 5021, None), ('relay', 5020, 'web1:5021')]
+    # "数据源@中继" 表示通过中继服务端查看其上游的某台服务器
+    hosts = []
+    for item in text.replace(',', ' ').split():
+        source, _, address = item.rpartition('@')
+        host, _, port = address.rpartition(':')
+        if host and port.isdigit():
+            hosts.append((host.strip('[]'), int(port), source or None))
+        else:
+            hosts.append((address, default_port, source or None))
+    return hosts
+
+def format_hosts(hosts):
+    return ', '.join(
+        f"{source}@{host}:{port}" if source else f"{host}:{port}"
+        for host, port, source in hosts
+    )
+
+def format_bytes(value):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TB"
+
+def convert_speed(speed):
+    if speed is None or speed < 0:
+        return "N/A", ""
+    if speed >= 1024 * 1024:
+        return f"{speed / (1024 * 1024):.2f}", "GB/s"
+    elif speed >= 1024:
+        return f"{speed / 1024:.2f}", "MB/s"
+    else:
+        return f"{speed:.2f}", "KB/s"
+
+class StatsStream:
+    """解析服务端数据流, feed() 返回本次收到的完整数据"""
+
+    def __init__(self):
+        # 握手应答之前 (或旧版服务端) 按行读取 JSON, 应答确认后切换到二进制帧
+        # 增量帧只包含变化的字段, 在 state 上重建完整数据
+        self.binary = False
+        self.buffer = bytearray()
+        self.state = None
+        self.timestamp = None
+        self.replies = []
+
+    def newer(self, stats):
+        # 只返回比上一个样本更新的数据, 服务端重复发送同一时刻的样本时不当作新样本
+        timestamp = stats.get('timestamp')
+        if timestamp is None:
+            return True
+        if self.timestamp is not None and timestamp <= self.timestamp:
+            return False
+        self.timestamp = timestamp
+        return True
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        samples = []
+        while True:
+            if self.binary:
+                if len(buffer) < FRAME_HEADER.size:
+                    break
+                frame_type, length = FRAME_HEADER.unpack_from(buffer)
+                end = FRAME_HEADER.size + length
+                if len(buffer) < end:
+                    break
+                payload = bytes(buffer[FRAME_HEADER.size:end])
+                del buffer[:end]
+                if frame_type == FRAME_STATS:
+                    self.state = decode_stats(payload)
+                elif frame_type == FRAME_DELTA and self.state is not None:
+                    apply_delta(self.state, decode_stats(payload, FRAME_DELTA))
+                elif frame_type == FRAME_REPLY:
+                    self.replies.append(json.loads(payload.decode('utf-8')))
+                    continue
+                else:
+                    continue
+                if self.newer(self.state):
+                    samples.append(copy_stats(self.state))
+            else:
+                end = buffer.find(b'\n')
+                if end < 0:
+                    break
+                message = json.loads(buffer[:end].decode('utf-8'))
+                del buffer[:end + 1]
+                if message.get('type') == 'hello':
+                    self.binary = message.get('format') == 'binary'
+                elif message.get('type') == 'reply':
+                    self.replies.append(message)
+                elif message.pop('delta', False):
+                    if self.state is not None:
+                        apply_delta(self.state, message)
+                        if self.newer(self.state):
+                            samples.append(copy_stats(self.state))
+                else:
+                    self.state = message
+                    if self.newer(self.state):
+                        samples.append(copy_stats(self.state))
+        return samples
+
+class StreamRecorder:
+    """把各连接收到的原始数据连同到达时间追加到录制文件"""
+
+    def __init__(self, path):
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(RECORD_MAGIC)
+        self.streams = {}
+
+    def open_stream(self, name):
+        # 每次建立连接时调用, 回放时据此重置该数据流的解析状态
+        index = self.streams.setdefault(name, len(self.streams))
+        self.write(RECORD_STREAM, index, name.encode('utf-8'))
+        return index
+
+    def record(self, index, data):
+        self.write(RECORD_DATA, index, data)
+
+    def write(self, kind, index, data):
+        self.file.write(RECORD_HEADER.pack(kind, time.time(), index, len(data)) + data)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def read_recording(path):
+    """依次返回 (时间戳, 数据流名称, 数据), 数据为 None 表示该数据流 (重新) 建立连接"""
+    with open(path, 'rb') as f:
+        if f.read(len(RECORD_MAGIC)) != RECORD_MAGIC:
+            raise ValueError(f"{path} 不是录制文件")
+        names = {}
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            kind, timestamp, index, length = RECORD_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                # 录制进程退出时可能只写了一半的最后一条记录
+                break
+            if kind == RECORD_STREAM:
+                names[index] = data.decode('utf-8')
+                yield timestamp, names[index], None
+            elif kind == RECORD_DATA and index in names:
+                yield timestamp, names[index], data
+
+def recording_streams(path):
+    return list(dict.fromkeys(name for _, name, data in read_recording(path) if data is None))
+
+class HostConnection:
+    """单台服务器的连接状态和最新数据, 子类可以在 update_history_data 中记录历史"""
+
+    def __init__(self, host, port, source=None):
+        self.host = host
+        self.port = port
+        self.source = source
+        self.name = f"{source}@{host}:{port}" if source else f"{host}:{port}"
+        self.data = {
+            'cpu': {'percent': 0, 'per_cpu': [], 'freq': 0},
+            'memory': {'used': 0, 'total': 0, 'percent': 0},
+            'network': {'bytes_sent': 0, 'bytes_recv': 0, 'upload_speed': 0, 'download_speed': 0},
+            'disk': {'read_speed': 0, 'write_speed': 0, 'read_ops': 0, 'write_ops': 0, 'devices': {}, 'mounts': []}
+        }
+        self.status = "正在连接服务器..."
+        self.connected = False
+        self.writer = None
+        self.last_timestamp = None
+
+    def ingest(self, new_data):
+        # 网络速度由服务端按单调时钟计算 (字节/秒), 界面和历史统一使用 KB/s
+        net = new_data.get('network')
+        if net is not None:
+            net['upload_speed'] = net.get('upload_speed', 0) / 1024
+            net['download_speed'] = net.get('download_speed', 0) / 1024
+        if 'interfaces' in new_data:
+            # 各网卡的字典与数据流的解析状态共用, 换算时复制而不是原地修改
+            new_data['interfaces'] = {
+                name: dict(
+                    nic,
+                    upload_speed=nic.get('upload_speed', 0) / 1024,
+                    download_speed=nic.get('download_speed', 0) / 1024
+                )
+                for name, nic in new_data['interfaces'].items()
+            }
+
+        # 未订阅的分组保留上一次的数据; 网卡列表整体替换, 已移除的网卡不再显示
+        data = dict(self.data)
+        for key, value in new_data.items():
+            if isinstance(value, dict) and key != 'interfaces':
+                data[key] = dict(data.get(key, {}), **value)
+            else:
+                data[key] = value
+        self.data = data
+        # 同一时刻的样本只更新最新数据, 不重复记入历史
+        timestamp = new_data.get('timestamp')
+        if timestamp is not None:
+            if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+                return
+            self.last_timestamp = timestamp
+        self.update_history_data(new_data)
+
+    def update_history_data(self, new_data):
+        pass
+
+    def prefill(self, reply):
+        pass
+
+class ConnectionManager(threading.Thread):
+    """在一个事件循环中复用所有服务器连接, 每台服务器一个协程
+
+    asyncio 导入较慢, 只在用到的方法中导入, 以免拖慢 --help、回放和只解析数据流的场景
+    """
+
+    def __init__(self, app, hosts, recorder=None):
+        import asyncio
+        super().__init__(daemon=True)
+        self.app = app
+        self.hosts = hosts
+        self.recorder = recorder
+        self.running = True
+        self.tasks = []
+        self.loop = asyncio.new_event_loop()
+
+    def run(self):
+        import asyncio
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.watch_all())
+        finally:
+            self.loop.close()
+
+    async def watch_all(self):
+        import asyncio
+        self.tasks = [asyncio.ensure_future(self.watch(state)) for state in self.hosts]
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def watch(self, state):
+        import asyncio
+        while self.running:
+            writer = None
+            retry = 0.5
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(state.host, state.port), timeout=5)
+                ip = writer.get_extra_info('peername')[0]
+                state.status = f"已连接到 {state.host} ({ip}):{state.port}"
+                state.connected = True
+                state.writer = writer
+                writer.write(self.app.hello(state))
+                query = self.app.history_query(state)
+                if query is not None:
+                    writer.write(query)
+                stream = StatsStream()
+                if self.recorder is not None:
+                    index = self.recorder.open_stream(state.name)
+                while self.running:
+                    data = await reader.read(65536)
+                    if not data:
+                        break
+                    if self.recorder is not None:
+                        self.recorder.record(index, data)
+                    for stats in stream.feed(data):
+                        state.ingest(stats)
+                    while stream.replies:
+                        reply = stream.replies.pop(0)
+                        if reply.get('id') == 'history' and 'series' in reply:
+                            state.prefill(reply)
+            except asyncio.TimeoutError:
+                state.status = "连接超时. 5秒后重试..."
+                retry = 5
+            except OSError as e:
+                state.status = f"连接错误: {str(e)}. 5秒后重试..."
+                retry = 5
+            except Exception as e:
+                state.status = f"错误: {str(e)}"
+            finally:
+                state.connected = False
+                state.writer = None
+                if writer is not None:
+                    writer.close()
+            await asyncio.sleep(retry)
+
+    def send(self, state, message):
+        # 由界面线程调用, 写操作交给事件循环线程执行
+        data = json.dumps(message).encode('utf-8') + b'\n'
+        try:
+            self.loop.call_soon_threadsafe(self.write, state, data)
+        except RuntimeError:
+            pass
+
+    def write(self, state, data):
+        if state.writer is not None:
+            state.writer.write(data)
+
+    def stop(self):
+        self.running = False
+        try:
+            self.loop.call_soon_threadsafe(self.cancel)
+        except RuntimeError:
+            pass
+
+    def cancel(self):
+        for task in self.tasks:
+            task.cancel()
+
+class ReplayManager(threading.Thread):
+    """回放录制文件: 数据按录制时的节奏经过与实时连接相同的解析和 ingest 路径, speed 为 0 时不等待"""
+
+    # 重新连接等造成的空白在回放时最多等待的秒数 (按录制时间计)
+    MAX_GAP = 5
+
+    def __init__(self, streams, path, speed=1):
+        # streams: 数据流名称 -> HostConnection
+        super().__init__(daemon=True)
+        self.streams = streams
+        self.path = path
+        self.speed = speed
+        self.running = True
+        self.wakeup = threading.Event()
+        self.samples = 0
+        self.elapsed = 0
+
+    def run(self):
+        parsers = {}
+        start = time.perf_counter()
+        offset = 0
+        last = None
+        try:
+            for timestamp, name, data in read_recording(self.path):
+                if not self.running:
+                    return
+                state = self.streams.get(name)
+                if state is None:
+                    continue
+                if last is not None:
+                    offset += min(max(timestamp - last, 0), self.MAX_GAP)
+                last = timestamp
+                if self.speed:
+                    delay = start + offset / self.speed - time.perf_counter()
+                    if delay > 0 and self.wakeup.wait(delay):
+                        return
+                if data is None:
+                    parsers[name] = StatsStream()
+                    state.connected = True
+                    state.status = f"正在回放 {self.path}"
+                    continue
+                stream = parsers[name]
+                for stats in stream.feed(data):
+                    state.ingest(stats)
+                    self.samples += 1
+                while stream.replies:
+                    reply = stream.replies.pop(0)
+                    if reply.get('id') == 'history' and 'series' in reply:
+                        state.prefill(reply)
+        except (OSError, ValueError) as e:
+            for state in self.streams.values():
+                state.status = f"回放错误: {e}"
+            return
+        self.elapsed = time.perf_counter() - start
+        rate = self.samples / self.elapsed if self.elapsed > 0 else 0
+        for state in self.streams.values():
+            state.connected = False
+            state.status = f"回放结束: {self.samples} 个样本, 用时 {self.elapsed:.2f} 秒 ({rate:.0f} 样本/秒)"
+
+    def send(self, state, message):
+        pass
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
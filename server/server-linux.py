@@ -1,101 +1,2290 @@
-import socket
+import asyncio
+import argparse
+import bisect
+import calendar
+import heapq
 import json
+import math
+import mmap
+import os
+import random
+import struct
+import sys
 import time
 import threading
+from array import array
+from collections import deque
+from datetime import datetime
+from functools import partial
 import psutil
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-def get_system_stats():
-    try:
-        cpu_freq = psutil.cpu_freq()
-        current_freq = cpu_freq.current if cpu_freq else 0
-    except Exception as e:
-        print(f"获取 CPU 频率时出错: {e}")
-        current_freq = 0
-    
-    mem = psutil.virtual_memory()
-    net_io = psutil.net_io_counters()
-    
-    return {
-        'cpu': {
-            'percent': psutil.cpu_percent(interval=None),
-            'per_cpu': psutil.cpu_percent(interval=None, percpu=True),
-            'freq': current_freq
-        },
-        'memory': {
+PROTOCOL_VERSION = 2
+
+# 二进制帧: 1 字节帧类型 + 4 字节负载长度, 均为网络字节序
+FRAME_HEADER = struct.Struct('!BI')
+FRAME_STATS = 1
+FRAME_DELTA = 2
+# 查询结果: 负载为 JSON, 只发给发出查询的客户端
+FRAME_REPLY = 3
+
+# 二进制帧中按固定格式打包的字段, 负载开头的掩码标记本帧包含哪些字段
+STATS_FIELDS = (
+    (('timestamp',), 'd'),
+    (('interval',), 'f'),
+    (('cpu', 'percent'), 'f'),
+    (('cpu', 'freq'), 'f'),
+    (('memory', 'used'), 'Q'),
+    (('memory', 'total'), 'Q'),
+    (('memory', 'percent'), 'f'),
+    (('network', 'bytes_sent'), 'Q'),
+    (('network', 'bytes_recv'), 'Q'),
+    (('network', 'upload_speed'), 'd'),
+    (('network', 'download_speed'), 'd'),
+)
+STATS_PATHS = {path for path, _ in STATS_FIELDS}
+# float32 字段保留的小数位数: 采样时按此取整, JSON 和二进制客户端得到相同的数值,
+# 接收端和持久化存储读出 float32 后再取整一次即可去掉单精度的舍入误差
+FLOAT_DIGITS = {
+    ('interval',): 3,
+    ('cpu', 'percent'): 1,
+    ('cpu', 'freq'): 1,
+    ('memory', 'percent'): 1,
+}
+HISTORY_METRICS = tuple('.'.join(path) for path, _ in STATS_FIELDS)
+MASK = struct.Struct('!I')
+COUNT = struct.Struct('!H')
+LENGTH = struct.Struct('!I')
+PER_CPU_BIT = 1 << 31
+EXTRA_BIT = 1 << 30
+CORE_CHANGE = struct.Struct('!HH')
+
+# 录制文件 (与客户端 --record 格式相同): 文件头之后是追加写入的记录,
+# 每条记录为 1 字节类型 + 8 字节时间戳 + 2 字节数据流编号 + 4 字节长度 + 数据.
+# RECORD_STREAM 声明数据流名称, RECORD_DATA 为该数据流的字节流 (与客户端收到的相同)
+RECORD_MAGIC = b'SMREC1\n'
+RECORD_HEADER = struct.Struct('!BdHI')
+RECORD_STREAM = 1
+RECORD_DATA = 2
+
+# 增量模式下变化小于该精度的字段视为未变化, 不重复发送
+DELTA_QUANTUM = {
+    ('interval',): 0.001,
+    ('cpu', 'percent'): 0.1,
+    ('cpu', 'freq'): 1,
+    ('memory', 'percent'): 0.1,
+    ('network', 'upload_speed'): 1,
+    ('network', 'download_speed'): 1,
+    ('disk', 'read_speed'): 1,
+    ('disk', 'write_speed'): 1,
+    ('disk', 'read_ops'): 0.1,
+    ('disk', 'write_ops'): 0.1,
+}
+PER_CPU_QUANTUM = 0.1
+
+# 客户端可订阅的指标分组, 未被任何客户端订阅的分组不会采集
+STATS_GROUPS = frozenset(('cpu', 'memory', 'network'))
+# 可选分组只发给显式订阅的客户端, 不计入默认订阅、历史和持久化
+OPTIONAL_GROUPS = frozenset(('processes', 'disk', 'interfaces'))
+ALL_GROUPS = STATS_GROUPS | OPTIONAL_GROUPS
+MAX_INTERVAL = 3600
+
+def interval_ticks(interval, min_interval):
+    interval = min(max(float(interval), min_interval), MAX_INTERVAL)
+    return max(1, round(interval / min_interval))
+
+def cpu_busy(times):
+    # CPU 时间 -> (忙碌时间, 总时间), 与 psutil.cpu_percent 相同: guest 已计入 user/nice, idle 和 iowait 视为空闲
+    total = sum(times) - getattr(times, 'guest', 0) - getattr(times, 'guest_nice', 0)
+    return total - times.idle - getattr(times, 'iowait', 0), total
+
+def get_system_stats(groups=STATS_GROUPS, per_cpu=True):
+    # CPU 返回累计时间而不是占用率, 由采样线程按各采样间隔自身的周期计算
+    stats = {}
+
+    if 'cpu' in groups:
+        try:
+            cpu_freq = psutil.cpu_freq()
+            current_freq = cpu_freq.current if cpu_freq else 0
+        except Exception as e:
+            print(f"获取 CPU 频率时出错: {e}")
+            current_freq = 0
+
+        stats['cpu'] = {'times': cpu_busy(psutil.cpu_times())}
+        if per_cpu:
+            stats['cpu']['core_times'] = [cpu_busy(times) for times in psutil.cpu_times(percpu=True)]
+        stats['cpu']['freq'] = current_freq
+
+    if 'memory' in groups:
+        mem = psutil.virtual_memory()
+        stats['memory'] = {
             'used': mem.used,
             'total': mem.total,
             'percent': mem.percent
-        },
-        'network': {
-            'bytes_sent': net_io.bytes_sent,
-            'bytes_recv': net_io.bytes_recv,
+        }
+
+    if 'interfaces' in groups:
+        # 按网卡采集时总量由各网卡相加, 每个周期只读取一次计数
+        pernic = psutil.net_io_counters(pernic=True)
+        stats['interfaces'] = {
+            name: {'bytes_sent': io.bytes_sent, 'bytes_recv': io.bytes_recv, 'upload_speed': 0, 'download_speed': 0}
+            for name, io in pernic.items()
+        }
+        bytes_sent = sum(io.bytes_sent for io in pernic.values())
+        bytes_recv = sum(io.bytes_recv for io in pernic.values())
+    elif 'network' in groups:
+        net_io = psutil.net_io_counters()
+        bytes_sent = net_io.bytes_sent
+        bytes_recv = net_io.bytes_recv
+
+    if 'network' in groups:
+        stats['network'] = {
+            'bytes_sent': bytes_sent,
+            'bytes_recv': bytes_recv,
             'upload_speed': 0,
             'download_speed': 0
         }
-    }
 
-def handle_client(conn, addr):
-    print(f"新的连接来自: {addr}")
-    last_bytes_sent = 0
-    last_bytes_recv = 0
-    last_time = time.time()
-    
-    try:
-        while True:
-            current_stats = get_system_stats()
-            
-            now = time.time()
-            time_diff = now - last_time
-            if time_diff > 0:
-                current_stats['network']['upload_speed'] = (
-                    (current_stats['network']['bytes_sent'] - last_bytes_sent) / time_diff
-                )
-                current_stats['network']['download_speed'] = (
-                    (current_stats['network']['bytes_recv'] - last_bytes_recv) / time_diff
-                )
-            
-            last_bytes_sent = current_stats['network']['bytes_sent']
-            last_bytes_recv = current_stats['network']['bytes_recv']
-            last_time = now
-            
+    return stats
+
+class SyntheticCollector:
+    """合成数据源, 用于可复现的基准测试: 各项数值是时间的确定函数, 与本机实际负载无关
+
+    每个核心和网卡按随机种子取不同相位, 波形为 sine/square/sawtooth/random, 取值在 0 到 1 之间;
+    CPU 忙碌时间和网络计数按波形对时间累加, 与真实计数一样单调递增, 任意采样间隔下算出的占用率和速度都与波形一致.
+    clock 默认为单调时钟, 测试中可以传入虚拟时钟. 进程和磁盘分组仍由真实的采集器提供.
+    """
+
+    WAVES = ('sine', 'square', 'sawtooth', 'random')
+
+    def __init__(self, cores=8, nics=2, wave='sine', period=60, rate=1024 ** 2, memory=16 * 1024 ** 3,
+                 freq=2400, seed=0, clock=None):
+        if wave not in self.WAVES:
+            raise ValueError(f"未知的波形: {wave}, 可选 {', '.join(self.WAVES)}")
+        if int(cores) < 1 or int(nics) < 1 or float(period) <= 0:
+            raise ValueError("cores 和 nics 至少为 1, period 必须大于 0")
+        rng = random.Random(seed)
+        self.wave = wave
+        self.period = float(period)
+        self.rate = float(rate)
+        self.memory = int(memory)
+        self.freq = float(freq)
+        self.clock = clock or time.monotonic
+        self.phases = [rng.random() for _ in range(int(cores))]
+        self.upload_phases = [rng.random() for _ in range(int(nics))]
+        self.download_phases = [rng.random() for _ in range(int(nics))]
+        # random 波形每个周期分 16 段, 每段取表中的一个值
+        self.table = [rng.random() for _ in range(1024)]
+        self.counters = {f"eth{i}": [0, 0] for i in range(int(nics))}
+        self.busy = [0.0] * int(cores)
+        self.cpu_time = 0.0
+        self.start = self.last = self.clock()
+
+    def levels(self, t, phases):
+        # 一次算出一组相位的波形值, 避免逐个核心调用方法
+        x = t / self.period
+        if self.wave == 'sine':
+            sin = math.sin
+            turn = 2 * math.pi
+            return [0.5 + 0.5 * sin(turn * (x + phase)) for phase in phases]
+        if self.wave == 'square':
+            return [1.0 if (x + phase) % 1 < 0.5 else 0.0 for phase in phases]
+        if self.wave == 'sawtooth':
+            return [(x + phase) % 1 for phase in phases]
+        table = self.table
+        return [table[int((x + phase) * 16) % len(table)] for phase in phases]
+
+    def collect(self, groups=STATS_GROUPS, per_cpu=True):
+        now = self.clock()
+        t = now - self.start
+        elapsed = max(now - self.last, 0)
+        self.last = now
+        # 计数在每次采集时都累加, 某个分组暂时无人订阅也不影响之后的占用率和速度
+        uploads = self.levels(t, self.upload_phases)
+        downloads = self.levels(t, self.download_phases)
+        for counter, upload, download in zip(self.counters.values(), uploads, downloads):
+            counter[0] += int(self.rate * upload * elapsed)
+            counter[1] += int(self.rate * download * elapsed)
+        self.busy = [busy + level * elapsed for busy, level in zip(self.busy, self.levels(t, self.phases))]
+        self.cpu_time += elapsed
+        stats = {}
+
+        if 'cpu' in groups:
+            stats['cpu'] = {'times': (sum(self.busy), self.cpu_time * len(self.busy))}
+            if per_cpu:
+                cpu_time = self.cpu_time
+                stats['cpu']['core_times'] = [(busy, cpu_time) for busy in self.busy]
+            stats['cpu']['freq'] = self.freq
+
+        if 'memory' in groups:
+            used = int(self.memory * (0.2 + 0.6 * self.levels(t, (0,))[0]))
+            stats['memory'] = {'used': used, 'total': self.memory, 'percent': round(used / self.memory * 100, 1)}
+
+        if 'interfaces' in groups:
+            stats['interfaces'] = {
+                name: {'bytes_sent': sent, 'bytes_recv': recv, 'upload_speed': 0, 'download_speed': 0}
+                for name, (sent, recv) in self.counters.items()
+            }
+        if 'network' in groups:
+            stats['network'] = {
+                'bytes_sent': sum(sent for sent, _ in self.counters.values()),
+                'bytes_recv': sum(recv for _, recv in self.counters.values()),
+                'upload_speed': 0,
+                'download_speed': 0
+            }
+
+        return stats
+
+def psutil_collector():
+    return get_system_stats
+
+def synthetic_collector(**options):
+    return SyntheticCollector(**options).collect
+
+# 采集后端: 名称 -> 工厂函数, 工厂返回 collect(groups, per_cpu), 由采样线程按订阅的分组调用
+COLLECTORS = {
+    'psutil': psutil_collector,
+    'synthetic': synthetic_collector,
+}
+DEFAULT_COLLECTOR = 'psutil'
+
+def create_collector(name, options=None):
+    return COLLECTORS[name](**(options or {}))
+
+def parse_options(text):
+    # "cores=256,nics=8,wave=square" -> {'cores': 256, 'nics': 8, 'wave': 'square'}
+    options = {}
+    for item in text.replace(',', ' ').split():
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError(f"选项应为 key=value 格式: {item}")
+        for convert in (int, float):
             try:
-                data = json.dumps(current_stats).encode('utf-8') + b'\n'
-                conn.sendall(data)
-            except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError) as e:
-                print(f"客户端 {addr} 断开连接: {e}")
+                value = convert(value)
                 break
-            except Exception as e:
-                print(f"发送数据到 {addr} 时出错: {e}")
-                break
-                
-            time.sleep(1)
-            
-    except Exception as e:
-        print(f"处理客户端 {addr} 时发生错误: {e}")
-    finally:
-        conn.close()
-        print(f"与 {addr} 的连接已关闭")
-
-def start_server(host='0.0.0.0', port=5021):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((host, port))
-        s.listen(5)
-        print(f"服务器启动，监听 {host}:{port}")
-        print("made by EXE_autumnwind 版本:2.0[Linux优化版]")
-        
+            except ValueError:
+                continue
+        options[key] = value
+    return options
+
+class ProcCollector:
+    """Linux 快速采集: /proc 下的文件保持打开, 每次用 os.preadv 读入复用的缓冲区, 只解析需要的字段
+
+    返回的数据与 get_system_stats 相同, 只在 Linux 上使用; 打开失败时回退到 psutil,
+    运行中读取或解析失败时关闭文件, 之后改用 psutil 采集
+    """
+
+    CPUFREQ_DIR = '/sys/devices/system/cpu/cpufreq'
+
+    def __init__(self):
+        self.fds = []
+        # CPU 时间与 psutil 一样换算为秒, 回退到 psutil 后计算基准仍然可用
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        try:
+            self.stat = self.open('/proc/stat')
+            self.meminfo = self.open('/proc/meminfo')
+            self.net_dev = self.open('/proc/net/dev')
+            self.freq = []
+            try:
+                policies = sorted(name for name in os.listdir(self.CPUFREQ_DIR) if name.startswith('policy'))
+                for name in policies:
+                    self.freq.append(self.open(os.path.join(self.CPUFREQ_DIR, name, 'scaling_cur_freq')))
+            except OSError:
+                for fd in self.freq:
+                    self.fds.remove(fd)
+                    os.close(fd)
+                self.freq = []
+            # 虚拟机等没有 cpufreq 时从 /proc/cpuinfo 读取频率
+            self.cpuinfo = None if self.freq else self.open('/proc/cpuinfo')
+        except OSError:
+            # 关闭已经打开的文件, 由调用方回退到 psutil
+            self.close()
+            raise
+        self.buffer = bytearray(16384)
+        self.nic_names = {}
+        # 网卡 -> [上次发送, 上次接收, 发送偏移, 接收偏移]
+        self.nic_counters = {}
+        self.fallback = None
+
+    def open(self, path):
+        fd = os.open(path, os.O_RDONLY)
+        self.fds.append(fd)
+        return fd
+
+    def read(self, fd):
+        # 文件比缓冲区大时扩大缓冲区后重读, 之后一直复用
         while True:
+            size = os.preadv(fd, [self.buffer], 0)
+            if size < len(self.buffer):
+                return size
+            self.buffer = bytearray(len(self.buffer) * 2)
+
+    def cpu_times(self):
+        # 返回总计和各核心的 (忙碌时间, 总时间), 单位为秒
+        # 与 psutil 相同: 只取 user..steal 8 列 (guest 已计入 user/nice), idle 和 iowait 视为空闲
+        size = self.read(self.stat)
+        # 只解析开头的 cpu 行, 不拆分之后很长的中断计数行
+        end = self.buffer.find(b'\nintr', 0, size)
+        total = None
+        cores = []
+        for line in self.buffer[:end if end >= 0 else size].split(b'\n'):
+            if not line.startswith(b'cpu'):
+                break
+            fields = line.split()
+            times = [int(value) for value in fields[1:9]]
+            jiffies = sum(times)
+            times = ((jiffies - times[3] - times[4]) / self.clock_ticks, jiffies / self.clock_ticks)
+            if fields[0] == b'cpu':
+                total = times
+            else:
+                cores.append(times)
+        return total, cores
+
+    def cpu_freq(self):
+        if self.freq:
+            # scaling_cur_freq 的单位是 kHz, 与 psutil 一样取各策略的平均值
+            return sum(int(os.pread(fd, 32, 0)) for fd in self.freq) / len(self.freq) / 1000
+        size = self.read(self.cpuinfo)
+        buffer = self.buffer
+        values = []
+        start = buffer.find(b'cpu MHz', 0, size)
+        while start >= 0:
+            colon = buffer.find(b':', start, size)
+            end = buffer.find(b'\n', colon, size)
+            values.append(float(buffer[colon + 1:end if end >= 0 else size]))
+            start = buffer.find(b'cpu MHz', colon, size)
+        if values:
+            return sum(values) / len(values)
+        cpu_freq = psutil.cpu_freq()
+        return cpu_freq.current if cpu_freq else 0
+
+    def meminfo_field(self, name, size):
+        start = self.buffer.find(name, 0, size)
+        if start < 0:
+            return None
+        start += len(name)
+        end = self.buffer.find(b'kB', start, size)
+        return int(self.buffer[start:end]) * 1024
+
+    def memory(self):
+        size = self.read(self.meminfo)
+        total = self.meminfo_field(b'MemTotal:', size)
+        available = self.meminfo_field(b'MemAvailable:', size)
+        if not total or not available or available > total:
+            # 旧内核没有 MemAvailable 或容器中数值异常时, 由 psutil 估算
+            mem = psutil.virtual_memory()
+            return {'used': mem.used, 'total': mem.total, 'percent': mem.percent}
+        used = total - available
+        return {'used': used, 'total': total, 'percent': round(used / total * 100, 1)}
+
+    def net_counters(self):
+        size = self.read(self.net_dev)
+        counters = {}
+        for line in self.buffer[:size].split(b'\n')[2:]:
+            name, sep, rest = line.partition(b':')
+            if not sep:
+                continue
+            fields = rest.split()
+            name = bytes(name)
+            key = self.nic_names.get(name)
+            if key is None:
+                key = self.nic_names[name] = name.strip().decode()
+            counters[key] = self.nowrap(key, int(fields[8]), int(fields[0]))
+        # 丢弃已移除网卡的偏移, 重新出现时从头计数
+        for key in self.nic_counters.keys() - counters.keys():
+            del self.nic_counters[key]
+        return counters
+
+    def nowrap(self, name, sent, recv):
+        # 与 psutil 的 nowrap 相同: 部分驱动的计数是 32 位的, 计数变小时把上次的值累加到偏移量上
+        last = self.nic_counters.get(name)
+        if last is None:
+            last = self.nic_counters[name] = [sent, recv, 0, 0]
+        if sent < last[0]:
+            last[2] += last[0]
+        if recv < last[1]:
+            last[3] += last[1]
+        last[0] = sent
+        last[1] = recv
+        return sent + last[2], recv + last[3]
+
+    def collect(self, groups=STATS_GROUPS, per_cpu=True):
+        if self.fallback is None:
+            try:
+                return self.collect_proc(groups, per_cpu)
+            except (OSError, ValueError, IndexError) as e:
+                # 运行中 /proc 不可读或格式不符时不终止采样线程, 改用 psutil
+                print(f"读取 /proc 时出错, 改用 psutil: {e}")
+                self.close()
+                self.fallback = get_system_stats
+        return self.fallback(groups, per_cpu)
+
+    def collect_proc(self, groups, per_cpu):
+        stats = {}
+
+        if 'cpu' in groups:
             try:
-                conn, addr = s.accept()
-                client_thread = threading.Thread(
-                    target=handle_client, 
-                    args=(conn, addr),
-                    daemon=True
+                current_freq = self.cpu_freq()
+            except (OSError, ValueError) as e:
+                print(f"获取 CPU 频率时出错: {e}")
+                current_freq = 0
+            total, cores = self.cpu_times()
+            stats['cpu'] = {'times': total}
+            if per_cpu:
+                stats['cpu']['core_times'] = cores
+            stats['cpu']['freq'] = current_freq
+
+        if 'memory' in groups:
+            stats['memory'] = self.memory()
+
+        if 'network' in groups or 'interfaces' in groups:
+            counters = self.net_counters()
+            if 'interfaces' in groups:
+                stats['interfaces'] = {
+                    name: {'bytes_sent': sent, 'bytes_recv': recv, 'upload_speed': 0, 'download_speed': 0}
+                    for name, (sent, recv) in counters.items()
+                }
+            if 'network' in groups:
+                stats['network'] = {
+                    'bytes_sent': sum(sent for sent, _ in counters.values()),
+                    'bytes_recv': sum(recv for _, recv in counters.values()),
+                    'upload_speed': 0,
+                    'download_speed': 0
+                }
+
+        return stats
+
+    def close(self):
+        while self.fds:
+            os.close(self.fds.pop())
+
+def proc_collector():
+    # /proc 不可用时回退到 psutil
+    try:
+        return ProcCollector().collect
+    except (OSError, ValueError) as e:
+        print(f"无法使用 /proc 快速采集, 改用 psutil: {e}")
+        return get_system_stats
+
+# Linux 上默认使用 /proc 快速采集
+COLLECTORS['proc'] = proc_collector
+DEFAULT_COLLECTOR = 'proc'
+
+class ProcessCollector:
+    """按 CPU 和内存占用排出前 N 个进程
+
+    进程对象按 pid 缓存, CPU 占用由相邻两次采集的 CPU 时间差计算;
+    每次只预取 CPU 时间和内存两个属性, 进程名和用户只为新进程查询一次
+    """
+
+    ATTRS = ['cpu_times', 'memory_info']
+
+    def __init__(self, top=10):
+        self.top = top
+        self.cache = {}
+        self.last_time = None
+
+    def describe(self, proc):
+        try:
+            name = proc.name()
+        except psutil.Error:
+            name = ''
+        try:
+            user = proc.username()
+        except (psutil.Error, KeyError):
+            # 用户已被删除时无法解析用户名
+            user = ''
+        return name, user
+
+    def collect(self):
+        now = time.monotonic()
+        elapsed = now - self.last_time if self.last_time is not None else 0
+        self.last_time = now
+        cache = {}
+        rows = []
+        for proc in psutil.process_iter(self.ATTRS, ad_value=None):
+            info = proc.info
+            cpu_times = info['cpu_times']
+            memory = info['memory_info']
+            if cpu_times is None or memory is None:
+                continue
+            cpu_time = cpu_times.user + cpu_times.system
+            entry = self.cache.get(proc.pid)
+            # process_iter 在 pid 被复用时会返回新的进程对象, 此时重新建立基准
+            if entry is None or entry[0] is not proc:
+                entry = [proc, cpu_time, None]
+            cpu = (cpu_time - entry[1]) / elapsed * 100 if elapsed > 0 else 0
+            entry[1] = cpu_time
+            cache[proc.pid] = entry
+            rows.append((max(cpu, 0), memory.rss, entry))
+        self.cache = cache
+
+        selected = {id(row[2]): row for row in heapq.nlargest(self.top, rows, key=lambda row: row[0])}
+        for row in heapq.nlargest(self.top, rows, key=lambda row: row[1]):
+            selected.setdefault(id(row[2]), row)
+        top = []
+        for cpu, rss, entry in selected.values():
+            proc = entry[0]
+            if entry[2] is None:
+                entry[2] = self.describe(proc)
+            name, user = entry[2]
+            top.append({'pid': proc.pid, 'name': name, 'user': user, 'cpu': round(cpu, 1), 'rss': rss})
+        return {'count': len(rows), 'top': top}
+
+def counter_rate(new, old, elapsed):
+    # 采集器返回的计数已处理回绕, 差值为负说明计数被重置 (如网卡被移除后重新添加), 按 0 处理
+    return round(max(new - old, 0) / elapsed, 1)
+
+def busy_percent(old, new):
+    total = new[1] - old[1]
+    if total <= 0:
+        return 0.0
+    return round(min(max((new[0] - old[0]) / total, 0), 1) * 100, 1)
+
+def core_percents(old, new):
+    # 与 busy_percent 相同, 核心数多时用 int 取一位小数, 比 round() 快得多
+    percents = []
+    for (old_busy, old_total), (busy, total) in zip(old, new):
+        total -= old_total
+        percents.append(int(min(max((busy - old_busy) / total, 0), 1) * 1000 + 0.5) / 10 if total > 0 else 0.0)
+    return percents
+
+def take_counters(stats, now):
+    """取出采集结果中的累计计数 (CPU 时间、网络字节数), 各采样间隔以上次到期时的计数为基准计算占用率和速度"""
+    counters = {}
+    cpu = stats.get('cpu')
+    if cpu is not None:
+        counters['cpu'] = cpu.pop('times')
+        if 'core_times' in cpu:
+            counters['cores'] = cpu.pop('core_times')
+    net = stats.get('network')
+    if net is not None:
+        counters['network'] = (now, net['bytes_sent'], net['bytes_recv'])
+    nics = stats.get('interfaces')
+    if nics is not None:
+        counters['interfaces'] = (now, {name: (nic['bytes_sent'], nic['bytes_recv']) for name, nic in nics.items()})
+    return counters
+
+def window_stats(stats, counters, base, interval):
+    """按计数基准 base 算出一个采样间隔内的 CPU 占用率和网络速度; 没有基准的计数 (刚开始采集) 记为 0"""
+    sample = dict(stats, interval=interval)
+    if 'cpu' in counters:
+        cpu = {'percent': busy_percent(base.get('cpu', counters['cpu']), counters['cpu'])}
+        cores = counters.get('cores')
+        if cores is not None:
+            old = base.get('cores')
+            # 核心数变化时从下一次开始计算
+            cpu['per_cpu'] = core_percents(old if old is not None and len(old) == len(cores) else cores, cores)
+        cpu.update(stats['cpu'])
+        sample['cpu'] = cpu
+    if 'network' in counters:
+        now, sent, recv = counters['network']
+        then, old_sent, old_recv = base.get('network', counters['network'])
+        if now > then:
+            sample['network'] = dict(
+                stats['network'],
+                upload_speed=counter_rate(sent, old_sent, now - then),
+                download_speed=counter_rate(recv, old_recv, now - then)
+            )
+    if 'interfaces' in counters:
+        # 新出现的网卡从下一次开始计算速度
+        now, nics = counters['interfaces']
+        then, old_nics = base.get('interfaces', (now, {}))
+        interfaces = {}
+        for name, nic in stats['interfaces'].items():
+            old = old_nics.get(name)
+            if old is not None and now > then:
+                nic = dict(
+                    nic,
+                    upload_speed=counter_rate(nic['bytes_sent'], old[0], now - then),
+                    download_speed=counter_rate(nic['bytes_recv'], old[1], now - then)
                 )
-                client_thread.start()
+            interfaces[name] = nic
+        sample['interfaces'] = interfaces
+    round_floats(sample)
+    return sample
+
+def io_rates(new, old, elapsed):
+    if old is None or elapsed <= 0:
+        return {'read_speed': 0, 'write_speed': 0, 'read_ops': 0, 'write_ops': 0}
+    return {
+        'read_speed': counter_rate(new.read_bytes, old.read_bytes, elapsed),
+        'write_speed': counter_rate(new.write_bytes, old.write_bytes, elapsed),
+        'read_ops': counter_rate(new.read_count, old.read_count, elapsed),
+        'write_ops': counter_rate(new.write_count, old.write_count, elapsed)
+    }
+
+class DiskCollector:
+    """磁盘读写速度、IOPS 和繁忙度由相邻两次计数的差值计算; 挂载点用量变化慢, 按更长的间隔采集"""
+
+    IGNORED_FSTYPES = ('squashfs',)
+
+    def __init__(self, usage_interval=30):
+        self.usage_interval = usage_interval
+        self.last_time = None
+        self.last_total = None
+        self.last_devices = {}
+        self.mounts = []
+        self.mounts_time = None
+
+    def collect(self):
+        now = time.monotonic()
+        elapsed = now - self.last_time if self.last_time is not None else 0
+        self.last_time = now
+
+        # 分区也会出现在每块磁盘的计数中, 总量取 psutil 按物理磁盘汇总的结果
+        total = psutil.disk_io_counters()
+        disk = io_rates(total, self.last_total, elapsed) if total is not None else {}
+        self.last_total = total
+
+        counters = psutil.disk_io_counters(perdisk=True) or {}
+        devices = {}
+        for name, io in counters.items():
+            if not (io.read_count or io.write_count):
+                continue
+            old = self.last_devices.get(name)
+            device = io_rates(io, old, elapsed)
+            # 繁忙度只在 Linux 等提供 busy_time 的平台上可用
+            busy_time = getattr(io, 'busy_time', None)
+            if busy_time is not None:
+                busy = (busy_time - old.busy_time) / (elapsed * 1000) * 100 if old is not None and elapsed > 0 else 0
+                device['busy'] = round(min(max(busy, 0), 100), 1)
+            devices[name] = device
+        self.last_devices = counters
+        disk['devices'] = devices
+
+        if self.mounts_time is None or now - self.mounts_time >= self.usage_interval:
+            self.mounts_time = now
+            self.mounts = self.collect_mounts()
+        disk['mounts'] = self.mounts
+        return disk
+
+    def collect_mounts(self):
+        mounts = []
+        seen = set()
+        for part in psutil.disk_partitions(all=False):
+            if part.mountpoint in seen or part.fstype in self.IGNORED_FSTYPES:
+                continue
+            seen.add(part.mountpoint)
+            try:
+                usage = psutil.disk_usage(part.mountpoint)
+            except OSError:
+                continue
+            if usage.total:
+                mounts.append({
+                    'mount': part.mountpoint,
+                    'device': part.device,
+                    'fstype': part.fstype,
+                    'used': usage.used,
+                    'total': usage.total,
+                    'percent': usage.percent
+                })
+        return mounts
+
+def select_stats(stats, groups, per_cpu):
+    selected = {}
+    for key, value in stats.items():
+        if key in ALL_GROUPS:
+            if key not in groups:
+                continue
+            if key == 'cpu' and not per_cpu and 'per_cpu' in value:
+                value = {k: v for k, v in value.items() if k != 'per_cpu'}
+        selected[key] = value
+    return selected
+
+_field_structs = {}
+
+def fields_struct(mask):
+    st = _field_structs.get(mask)
+    if st is None:
+        fmt = ''.join(code for i, (_, code) in enumerate(STATS_FIELDS) if mask & (1 << i))
+        st = _field_structs[mask] = struct.Struct('!' + fmt)
+    return st
+
+def split_extras(stats):
+    """返回二进制固定字段无法表示的部分, 以 JSON 附加在帧尾"""
+    extras = {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            rest = {k: v for k, v in value.items() if (key, k) not in STATS_PATHS and k != 'per_cpu'}
+            if rest:
+                extras[key] = rest
+        elif (key,) not in STATS_PATHS:
+            extras[key] = value
+    return extras
+
+def round_floats(stats):
+    for path, digits in FLOAT_DIGITS.items():
+        group = stats.get(path[0]) if len(path) > 1 else stats
+        if isinstance(group, dict) and group.get(path[-1]) is not None:
+            group[path[-1]] = round(group[path[-1]], digits)
+
+def quantize_usage(value):
+    # 每个核心占用率量化为 0.01%, 以 uint16 打包
+    return min(max(int(round(value * 100)), 0), 10000)
+
+def pack_per_cpu(per_cpu):
+    if isinstance(per_cpu, dict):
+        # 增量帧只携带变化的核心: 数量 + (序号, 占用率) 对
+        return COUNT.pack(len(per_cpu)) + b''.join(
+            CORE_CHANGE.pack(index, quantize_usage(value)) for index, value in per_cpu.items()
+        )
+    packed = array('H', (quantize_usage(v) for v in per_cpu))
+    if sys.byteorder == 'little':
+        packed.byteswap()
+    return COUNT.pack(len(per_cpu)) + packed.tobytes()
+
+def encode_binary(stats, frame_type=FRAME_STATS):
+    mask = 0
+    values = []
+    for i, (path, code) in enumerate(STATS_FIELDS):
+        value = stats
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if value is None:
+            continue
+        mask |= 1 << i
+        values.append(int(value) if code == 'Q' else float(value))
+
+    tail = b''
+    per_cpu = stats.get('cpu', {}).get('per_cpu')
+    if per_cpu is not None:
+        mask |= PER_CPU_BIT
+        tail += pack_per_cpu(per_cpu)
+    extras = split_extras(stats)
+    if extras:
+        mask |= EXTRA_BIT
+        blob = json.dumps(extras, separators=(',', ':')).encode('utf-8')
+        tail += LENGTH.pack(len(blob)) + blob
+
+    payload = MASK.pack(mask) + fields_struct(mask).pack(*values) + tail
+    return FRAME_HEADER.pack(frame_type, len(payload)) + payload
+
+def encode_json(stats):
+    return json.dumps(stats).encode('utf-8') + b'\n'
+
+def encode_binary_delta(delta):
+    return encode_binary(delta, FRAME_DELTA)
+
+def encode_json_delta(delta):
+    return json.dumps(dict(delta, delta=True)).encode('utf-8') + b'\n'
+
+def encode_message(message):
+    return json.dumps(message).encode('utf-8') + b'\n'
+
+def encode_reply(fmt, message):
+    if fmt == 'binary':
+        payload = json.dumps(message, separators=(',', ':')).encode('utf-8')
+        return FRAME_HEADER.pack(FRAME_REPLY, len(payload)) + payload
+    return encode_message(message)
+
+ENCODERS = {
+    'json': encode_json,
+    'binary': encode_binary,
+}
+DELTA_ENCODERS = {
+    'json': encode_json_delta,
+    'binary': encode_binary_delta,
+}
+
+def changed(old, new, quantum):
+    if old is None or quantum is None:
+        return old != new
+    return abs(new - old) >= quantum
+
+def copy_stats(stats):
+    copied = {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            value = dict(value)
+            if 'per_cpu' in value:
+                value['per_cpu'] = list(value['per_cpu'])
+        copied[key] = value
+    return copied
+
+def diff_stats(reference, stats):
+    """返回相对 reference 变化的字段并写回 reference; 结构变化时返回 None 表示需要关键帧"""
+    if reference.keys() != stats.keys():
+        return None
+    delta = {}
+    for key, value in stats.items():
+        old = reference[key]
+        if not isinstance(value, dict):
+            if changed(old, value, DELTA_QUANTUM.get((key,))):
+                delta[key] = reference[key] = value
+            continue
+        if not isinstance(old, dict) or old.keys() != value.keys():
+            return None
+
+        group = {}
+        for k, v in value.items():
+            if k == 'per_cpu':
+                old_cores = old[k]
+                if len(old_cores) != len(v):
+                    return None
+                cores = {}
+                for index, usage in enumerate(v):
+                    if abs(usage - old_cores[index]) >= PER_CPU_QUANTUM:
+                        cores[index] = old_cores[index] = usage
+                if cores:
+                    group[k] = cores
+            elif changed(old[k], v, DELTA_QUANTUM.get((key, k))):
+                group[k] = old[k] = v
+        if group:
+            delta[key] = group
+    return delta
+
+class Channel:
+    """编码方式相同的一组客户端, 共享每个周期的序列化结果和增量基准"""
+
+    def __init__(self, key, keyframe_interval):
+        self.key = key
+        self.source, self.format, self.delta, self.groups, self.per_cpu, self.ticks = key
+        self.keyframe_interval = keyframe_interval
+        self.clients = set()
+        self.reference = None
+        self.since_keyframe = 0
+
+    def covers(self, stats):
+        # 订阅刚变化时采样器可能还没采集新分组, 这一周期先跳过
+        if not self.groups.issubset(stats):
+            return False
+        return not (self.per_cpu and 'cpu' in self.groups and 'per_cpu' not in stats['cpu'])
+
+    def encode(self, stats):
+        stats = select_stats(stats, self.groups, self.per_cpu)
+        if self.delta:
+            if self.reference is not None and self.since_keyframe < self.keyframe_interval:
+                delta = diff_stats(self.reference, stats)
+                if delta is not None:
+                    self.since_keyframe += 1
+                    return DELTA_ENCODERS[self.format](delta)
+            self.since_keyframe = 0
+        self.reference = copy_stats(stats) if self.delta else stats
+        return ENCODERS[self.format](self.reference)
+
+    def keyframe(self):
+        # 新加入或丢过帧的客户端需要以接收端当前应有的状态作为关键帧
+        if self.reference is None:
+            return None
+        return ENCODERS[self.format](self.reference)
+
+class StatsSampler(threading.Thread):
+    def __init__(self, interval=1, min_interval=0.1, top=10, disk_usage_interval=30):
+        super().__init__(daemon=True)
+        # min_interval 既是时间轮的刻度, 也是服务端允许的最小采样间隔
+        self.interval = interval
+        self.min_interval = min_interval
+        self.collect = get_system_stats
+        self.processes = ProcessCollector(top)
+        self.disks = DiskCollector(disk_usage_interval)
+        self.listeners = []
+        self.stats = None
+        self.metrics = None
+        self.rollup = None
+        self.rates = {}
+        self.requested = {}
+        self.reserved = {}
+        self.wakeup = threading.Event()
+
+    def ticks_for(self, interval):
+        return interval_ticks(interval, self.min_interval)
+
+    def set_rates(self, rates):
+        # rates: 刻度数 -> (分组, 是否需要每核心数据)
+        self.requested = rates
+        merged = dict(rates)
+        for ticks, (groups, per_cpu) in self.reserved.items():
+            old_groups, old_per_cpu = merged.get(ticks, (frozenset(), False))
+            merged[ticks] = (old_groups | groups, old_per_cpu or per_cpu)
+        self.rates = merged
+        self.wakeup.set()
+
+    def reserve(self, ticks, groups, per_cpu):
+        # 服务端自身需要的固定采样 (如持久化存储), 与客户端通道的采样合并
+        self.reserved[ticks] = (frozenset(groups), per_cpu)
+        self.set_rates(self.requested)
+
+    def run(self):
+        # 先采集一次, 作为 CPU 占用率和网络速度的计算基准
+        start = last_time = time.monotonic()
+        latest = take_counters(self.collect(STATS_GROUPS, True), start)
+        # 各采样间隔上次到期时采集到的累计计数: 10 秒的通道按 10 秒内的 CPU 时间和字节数计算,
+        # 而不是与更快的通道共用最近一次采集以来的瞬时值. 只保留当次实际采集的计数,
+        # 上次到期时未采集的计数 (如刚开启每核心数据或网络分组) 没有基准, 记为 0
+        baselines = {}
+        last_sampled = {}
+        tick = 0
+
+        while True:
+            rates = self.rates
+            if not rates:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+
+            # 时间轮: 各采样间隔在其刻度数的整数倍上到期, 同一刻度到期的通道共用一次采样
+            due_tick = min((tick // ticks + 1) * ticks for ticks in rates)
+            delay = start + due_tick * self.min_interval - time.monotonic()
+            if delay > 0 and self.wakeup.wait(delay):
+                self.wakeup.clear()
+                continue
+            now = time.monotonic()
+            # 采集耗时超过一个刻度时跳过错过的刻度, 不连续补采
+            tick = max(due_tick, int((now - start) / self.min_interval))
+
+            due = [ticks for ticks in rates if due_tick % ticks == 0]
+            groups = set()
+            per_cpu = False
+            for ticks in due:
+                groups |= rates[ticks][0]
+                per_cpu = per_cpu or rates[ticks][1]
+
+            try:
+                current_stats = self.collect(groups, per_cpu)
+                if 'processes' in groups:
+                    current_stats['processes'] = self.processes.collect()
+                if 'disk' in groups:
+                    current_stats['disk'] = self.disks.collect()
+                current_stats['timestamp'] = time.time()
+                counters = take_counters(current_stats, now)
+
+                # 每个采样间隔各自测量实际周期, 按自身的计数基准计算; 上次同时到期的间隔基准相同, 只计算一次
+                windows = {}
+                computed = {}
+                for ticks in due:
+                    # 新加入的间隔以最近一次采集为基准
+                    elapsed = now - last_sampled.get(ticks, last_time)
+                    interval = round(elapsed, FLOAT_DIGITS[('interval',)])
+                    base = baselines.get(ticks, latest)
+                    key = (id(base), interval)
+                    if key not in computed:
+                        computed[key] = window_stats(current_stats, counters, base, interval)
+                    windows[ticks] = computed[key]
             except Exception as e:
-                print(f"接受新连接时出错: {e}")
-                time.sleep(1)
+                print(f"采集系统数据时出错: {e}")
+                continue
+
+            latest = counters
+            last_time = now
+            for ticks in due:
+                baselines[ticks] = latest
+                last_sampled[ticks] = now
+            for ticks in list(last_sampled):
+                if ticks not in rates:
+                    del last_sampled[ticks]
+                    baselines.pop(ticks, None)
+
+            self.stats = windows[min(due)]
+            for listener in self.listeners:
+                listener(self.stats, windows)
+
+class UpstreamSource:
+    """中继模式下的一台上游服务端: 只订阅一次, 保存最新数据和最近的历史, 供下游客户端共享"""
+
+    RETRY = 5
+
+    def __init__(self, host, port, interval=1, min_interval=0.1, history=600):
+        self.host = host
+        self.port = port
+        self.name = f"{host}:{port}"
+        self.interval = interval
+        self.min_interval = min_interval
+        self.listeners = []
+        self.stats = None
+        self.history = deque(maxlen=history)
+        self.metrics = MetricHistory(history, interval)
+        self.rollup = None
+        self.rates = {}
+        self.writer = None
+        self.subscription = None
+        self.last_sampled = {}
+        self.last_timestamp = None
+
+    def ticks_for(self, interval):
+        return interval_ticks(interval, self.min_interval)
+
+    def set_rates(self, rates):
+        self.rates = rates
+        self.subscribe()
+
+    def upstream_subscription(self):
+        # 上游始终推送全部分组以保留完整历史, 可选分组只在下游有人订阅时转发
+        # 间隔取下游通道中最快的一个
+        ticks = min([self.ticks_for(self.interval), *self.rates])
+        groups = STATS_GROUPS.union(*(groups for groups, _ in self.rates.values()))
+        return {
+            'groups': sorted(groups),
+            'per_cpu': any(per_cpu for _, per_cpu in self.rates.values()),
+            'interval': round(ticks * self.min_interval, 6)
+        }
+
+    def subscribe(self):
+        subscription = self.upstream_subscription()
+        if self.writer is not None and subscription != self.subscription:
+            self.subscription = subscription
+            self.writer.write(encode_message(dict(subscription, type='subscribe')))
+
+    async def follow(self):
+        while True:
+            writer = None
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                print(f"已连接上游服务端 {self.name}")
+                self.subscription = self.upstream_subscription()
+                self.last_timestamp = None
+                writer.write(encode_message(dict(
+                    self.subscription,
+                    type='hello',
+                    version=PROTOCOL_VERSION,
+                    format='json',
+                    delta=False
+                )))
+                self.writer = writer
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    message = json.loads(line.decode('utf-8'))
+                    if message.get('type') != 'hello':
+                        self.receive(message)
+            except (OSError, ValueError) as e:
+                print(f"上游服务端 {self.name} 连接错误: {e}")
+            finally:
+                self.writer = None
+                if writer is not None:
+                    writer.close()
+            print(f"{self.RETRY} 秒后重新连接上游服务端 {self.name}")
+            await asyncio.sleep(self.RETRY)
+
+    def receive(self, stats):
+        # 只转发比上一个更新的样本, 上游重复发送同一时刻的样本时丢弃
+        timestamp = stats.get('timestamp')
+        if timestamp is not None:
+            if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+                return
+            self.last_timestamp = timestamp
+        now = time.monotonic()
+        self.stats = stats
+        self.history.append(stats)
+        self.metrics.append(stats)
+
+        # 上游按最快的通道推送, 较慢的通道距上次发送满一个自身间隔 (留半个基础间隔的余量) 时到期,
+        # 转发到期时上游最新的样本
+        base = self.ticks_for(self.subscription['interval']) if self.subscription else 1
+        windows = {}
+        for ticks in self.rates:
+            last = self.last_sampled.get(ticks)
+            if last is None or now - last >= (ticks - base / 2) * self.min_interval:
+                elapsed = now - last if last is not None else stats.get('interval', 0)
+                windows[ticks] = dict(stats, interval=round(elapsed, FLOAT_DIGITS[('interval',)]))
+                self.last_sampled[ticks] = now
+        for ticks in list(self.last_sampled):
+            if ticks not in self.rates:
+                del self.last_sampled[ticks]
+
+        for listener in self.listeners:
+            listener(stats, windows)
+
+MAX_QUERY_POINTS = 10000
+
+class MetricHistory:
+    """最近样本的内存历史: 每个字段一列定长环形数组, 每个值写入两份, 最近 n 个值在内存中始终连续"""
+
+    label = 'raw'
+
+    def __init__(self, capacity, resolution=1):
+        self.capacity = capacity
+        self.resolution = resolution
+        self.columns = {name: array('d', bytes(16 * capacity)) for name in HISTORY_METRICS}
+        self.index = 0
+        self.count = 0
+        self.ticks = None
+
+    def attach(self, sampler, interval):
+        self.resolution = interval
+        self.ticks = sampler.ticks_for(interval)
+        sampler.reserve(self.ticks, STATS_GROUPS, False)
+        sampler.listeners.append(self.record)
+
+    def record(self, stats, windows):
+        if self.ticks in windows:
+            self.append(windows[self.ticks])
+
+    def append(self, stats):
+        index = self.index
+        for (path, _), name in zip(STATS_FIELDS, HISTORY_METRICS):
+            value = stats
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            value = float('nan') if value is None else float(value)
+            column = self.columns[name]
+            column[index] = value
+            column[index + self.capacity] = value
+        self.index = (index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def window(self, start, end):
+        """返回 [start, end] 范围内各列的副本"""
+        end_index = self.index + self.capacity
+        start_index = end_index - self.count
+        timestamps = self.columns['timestamp'][start_index:end_index]
+        lo = start_index + bisect.bisect_left(timestamps, start)
+        hi = start_index + bisect.bisect_right(timestamps, end)
+        return {name: column[lo:hi] for name, column in self.columns.items()}
+
+    def oldest(self):
+        if not self.count:
+            return None
+        return self.columns['timestamp'][self.index + self.capacity - self.count]
+
+    def supports(self, names):
+        return set(names).issubset(HISTORY_METRICS[1:])
+
+    def select(self, names, start, end):
+        # 原始样本的最小/最大/平均值是同一组数据
+        window = self.window(start, end)
+        return window['timestamp'], {name: dict.fromkeys(('min', 'max', 'avg'), window[name]) for name in names}
+
+def choose_table(tables, start, span):
+    """选择覆盖查询起点、分辨率不超过每个点时间跨度的最粗的表; 都不覆盖起点时选数据最久远的表"""
+    covering = [table for table in tables if table.oldest() is not None and table.oldest() <= start]
+    if not covering:
+        return min(tables, key=lambda table: table.oldest() if table.oldest() is not None else float('inf'))
+    fine = [table for table in covering if table.resolution <= span]
+    if fine:
+        return max(fine, key=lambda table: table.resolution)
+    return min(covering, key=lambda table: table.resolution)
+
+def to_list(values, digits=3):
+    if hasattr(values, 'tolist'):
+        values = values.tolist()
+    return [None if v != v else round(v, digits) for v in values]
+
+def downsample_minmax(timestamps, columns, points):
+    """按样本数等分为 points 个桶, 返回每桶起始时间和各列各统计量的桶内结果 (忽略缺失值)
+
+    columns: 指标 -> {统计量: 数组}. 平均值取桶内平均, 最小值取最小, 最大值和 p95 取最大
+    """
+    n = len(timestamps)
+    points = min(points, n)
+    series = {}
+    if np is not None:
+        starts = np.arange(points) * n // points
+        for name, stats in columns.items():
+            series[name] = {}
+            for stat, values in stats.items():
+                if stat == 'avg':
+                    valid = ~np.isnan(values)
+                    sums = np.add.reduceat(np.where(valid, values, 0), starts)
+                    counts = np.add.reduceat(valid.astype(np.int64), starts)
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        result = sums / counts
+                else:
+                    result = (np.fmin if stat == 'min' else np.fmax).reduceat(values, starts)
+                series[name][stat] = to_list(result)
+        return to_list(timestamps[starts]), series
+
+    starts = [i * n // points for i in range(points)]
+    ends = starts[1:] + [n]
+    for name, stats in columns.items():
+        series[name] = {}
+        for stat, values in stats.items():
+            reduce = {'min': min, 'avg': lambda bucket: sum(bucket) / len(bucket)}.get(stat, max)
+            result = []
+            for start, end in zip(starts, ends):
+                bucket = [v for v in values[start:end] if v == v]
+                result.append(reduce(bucket) if bucket else float('nan'))
+            series[name][stat] = to_list(result)
+    return to_list([timestamps[i] for i in starts]), series
+
+def lttb_indices(x, y, points):
+    """Largest-Triangle-Three-Buckets 降采样, 返回保留的样本下标"""
+    n = len(x)
+    if n <= points:
+        return list(range(n))
+    every = (n - 2) / (points - 2)
+    selected = [0]
+    a = 0
+    for i in range(points - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        count = next_end - end
+        if np is not None:
+            avg_x = x[end:next_end].mean()
+            avg_y = y[end:next_end].mean()
+            area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+            a = start + int(area.argmax())
+        else:
+            avg_x = sum(x[end:next_end]) / count
+            avg_y = sum(y[end:next_end]) / count
+            ax, ay = x[a], y[a]
+            a = max(range(start, end), key=lambda j: abs((ax - avg_x) * (y[j] - ay) - (ax - x[j]) * (avg_y - ay)))
+        selected.append(a)
+    selected.append(n - 1)
+    return selected
+
+def downsample_lttb(timestamps, columns, points):
+    series = {}
+    for name, stats in columns.items():
+        # 每列按平均值各自选点, 缺失值不参与
+        values = stats['avg']
+        if np is not None:
+            valid = ~np.isnan(values)
+            x, y = timestamps[valid], values[valid]
+        else:
+            pairs = [(t, v) for t, v in zip(timestamps, values) if v == v]
+            x, y = [t for t, _ in pairs], [v for _, v in pairs]
+        indices = lttb_indices(x, y, points)
+        series[name] = {
+            'timestamp': to_list([x[i] for i in indices] if np is None else x[indices]),
+            'value': to_list([y[i] for i in indices] if np is None else y[indices])
+        }
+    return series
+
+# 聚合层级文件: 环形保存定长行, 每行为一个时间桶内各指标和各核心的最小/最大/平均/p95
+TIER_MAGIC = b'SMRT'
+TIER_VERSION = 1
+TIER_HEADER = struct.Struct('<4sHIIHII')
+TIER_POSITION = struct.Struct('<II')
+TIER_POSITION_OFFSET = struct.calcsize('<4sHIIH')
+TIER_METRICS = HISTORY_METRICS[1:]
+TIER_STATS = ('min', 'max', 'mean', 'p95')
+TIER_COLUMNS = ('timestamp', 'samples') + tuple(f'{name}.{stat}' for name in TIER_METRICS for stat in TIER_STATS)
+TIER_VALUE = struct.Struct('<d')
+PER_CPU_METRIC = 'cpu.per_cpu.'
+
+def parse_duration(text):
+    # "10s", "1m", "1h", "7d" 或秒数
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if text[-1:] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+def parse_tiers(text):
+    # "10s:1d,1m:7d" -> [('10s', 10, 86400), ('1m', 60, 604800)]
+    tiers = []
+    for item in text.replace(',', ' ').split():
+        label, _, retention = item.partition(':')
+        resolution = int(parse_duration(label))
+        if resolution <= 0 or not retention:
+            raise ValueError(item)
+        tiers.append((label, resolution, parse_duration(retention)))
+    return tiers
+
+def summarize(values):
+    """返回 (最小, 最大, 平均, p95), p95 按最近秩法计算"""
+    values = sorted(v for v in values if v == v)
+    if not values:
+        return (float('nan'),) * 4
+    return values[0], values[-1], sum(values) / len(values), values[max(0, math.ceil(len(values) * 0.95) - 1)]
+
+class RollupTier:
+    """一个聚合层级: 每 resolution 秒一行, 环形保存 capacity 行, 超出保留期限的行被覆盖, 占用空间固定"""
+
+    def __init__(self, label, resolution, capacity, cores, path=None):
+        self.label = label
+        self.resolution = resolution
+        self.capacity = capacity
+        self.cores = cores
+        self.row_cores = cores * len(TIER_STATS)
+        self.offsets = {}
+        offset = STORE_HEADER_SIZE
+        for name in TIER_COLUMNS:
+            self.offsets[name] = offset
+            offset += capacity * TIER_VALUE.size
+        self.per_cpu_offset = offset
+        size = offset + capacity * self.row_cores * 2
+
+        # 没有持久化目录时使用匿名内存; 已有文件的层级参数一致时接着使用, 否则清空重建
+        self.file = None
+        if path is None:
+            self.mm = mmap.mmap(-1, size)
+        else:
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            self.file = open(path, 'r+b')
+            if os.fstat(self.file.fileno()).st_size != size:
+                self.file.truncate(size)
+            self.mm = mmap.mmap(self.file.fileno(), size)
+        header = TIER_HEADER.pack(TIER_MAGIC, TIER_VERSION, resolution, capacity, cores, 0, 0)
+        if self.mm[:TIER_POSITION_OFFSET] != header[:TIER_POSITION_OFFSET]:
+            self.mm[:TIER_HEADER.size] = header
+
+    def position(self):
+        return TIER_POSITION.unpack_from(self.mm, TIER_POSITION_OFFSET)
+
+    def append(self, columns, per_cpu):
+        index, count = self.position()
+        for name, value in columns.items():
+            TIER_VALUE.pack_into(self.mm, self.offsets[name] + index * TIER_VALUE.size, value)
+        if self.row_cores:
+            if sys.byteorder == 'big':
+                per_cpu.byteswap()
+            start = self.per_cpu_offset + index * self.row_cores * 2
+            self.mm[start:start + self.row_cores * 2] = per_cpu.tobytes()
+        TIER_POSITION.pack_into(self.mm, TIER_POSITION_OFFSET, (index + 1) % self.capacity, min(count + 1, self.capacity))
+
+    def ordered(self, offset, item_size, position):
+        # 按时间顺序取出一列: 未写满时从头开始, 写满后从当前写入位置开始
+        index, count = position
+        if count < self.capacity:
+            return self.mm[offset:offset + count * item_size]
+        split = offset + index * item_size
+        return self.mm[split:offset + self.capacity * item_size] + self.mm[offset:split]
+
+    def column(self, name, position):
+        values = array('d')
+        values.frombytes(self.ordered(self.offsets[name], TIER_VALUE.size, position))
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+
+    def oldest(self):
+        index, count = self.position()
+        if not count:
+            return None
+        first = index if count == self.capacity else 0
+        return TIER_VALUE.unpack_from(self.mm, self.offsets['timestamp'] + first * TIER_VALUE.size)[0]
+
+    def core_index(self, name):
+        if name.startswith(PER_CPU_METRIC) and name[len(PER_CPU_METRIC):].isdigit():
+            core = int(name[len(PER_CPU_METRIC):])
+            if core < self.cores:
+                return core
+        return None
+
+    def supports(self, names):
+        return all(name in TIER_METRICS or self.core_index(name) is not None for name in names)
+
+    def select(self, names, start, end):
+        position = self.position()
+        timestamps = self.column('timestamp', position)
+        lo = bisect.bisect_left(timestamps, start)
+        hi = bisect.bisect_right(timestamps, end)
+        per_cpu = None
+        columns = {}
+        for name in names:
+            core = self.core_index(name)
+            if core is None:
+                columns[name] = {
+                    'avg' if stat == 'mean' else stat: self.column(f'{name}.{stat}', position)[lo:hi]
+                    for stat in TIER_STATS
+                }
+                continue
+            if per_cpu is None:
+                per_cpu = array('H')
+                per_cpu.frombytes(self.ordered(self.per_cpu_offset, self.row_cores * 2, position))
+                if sys.byteorder == 'big':
+                    per_cpu.byteswap()
+            columns[name] = {
+                'avg' if stat == 'mean' else stat:
+                    array('d', (v / 100 for v in per_cpu[(core * len(TIER_STATS) + k)::self.row_cores][lo:hi]))
+                for k, stat in enumerate(TIER_STATS)
+            }
+        return timestamps[lo:hi], columns
+
+    def close(self):
+        self.mm.close()
+        if self.file is not None:
+            self.file.close()
+
+class RollupBucket:
+    """一个层级当前正在累积的时间桶"""
+
+    def __init__(self, start, cores):
+        self.start = start
+        self.samples = 0
+        self.values = {name: [] for name in TIER_METRICS}
+        self.cores = [array('H') for _ in range(cores)]
+
+    def add(self, values, per_cpu):
+        self.samples += 1
+        for name, value in values.items():
+            if value is not None:
+                self.values[name].append(value)
+        for core, usage in zip(self.cores, per_cpu):
+            core.append(quantize_usage(usage))
+
+    def summary(self):
+        columns = {'timestamp': self.start, 'samples': self.samples}
+        for name, values in self.values.items():
+            for stat, value in zip(TIER_STATS, summarize(values)):
+                columns[f'{name}.{stat}'] = value
+        per_cpu = array('H')
+        for core in self.cores:
+            per_cpu.extend(0 if v != v else int(round(v)) for v in summarize(core))
+        return columns, per_cpu
+
+class Rollup:
+    """保留期限子系统: 原始样本持续聚合为多个分辨率的层级, 长时间范围的查询直接使用聚合结果"""
+
+    def __init__(self, tiers, directory=None, interval=1):
+        # tiers: [(标签, 分辨率秒数, 保留秒数)]
+        self.spec = tiers
+        self.directory = directory
+        self.interval = interval
+        self.tiers = []
+        self.buckets = []
+        self.cores = None
+        self.ticks = None
+
+    def attach(self, sampler):
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        self.ticks = sampler.ticks_for(self.interval)
+        sampler.reserve(self.ticks, STATS_GROUPS, True)
+        sampler.listeners.append(self.record)
+
+    def create_tiers(self, cores):
+        # 核心数以第一条样本为准, 之后核心数变化时多出的核心不计入
+        tiers = []
+        for label, resolution, retention in self.spec:
+            path = os.path.join(self.directory, f'rollup-{label}.tier') if self.directory else None
+            tiers.append(RollupTier(label, resolution, max(1, int(retention // resolution)), cores, path))
+        self.tiers = tiers
+        self.buckets = [None] * len(tiers)
+        self.cores = cores
+
+    def record(self, stats, windows):
+        if self.ticks not in windows:
+            return
+        try:
+            self.add(windows[self.ticks])
+        except (OSError, ValueError) as e:
+            print(f"聚合历史数据时出错: {e}")
+
+    def add(self, stats):
+        per_cpu = stats.get('cpu', {}).get('per_cpu') or []
+        if self.cores is None:
+            self.create_tiers(len(per_cpu))
+        values = {}
+        for (path, _), name in zip(STATS_FIELDS[1:], TIER_METRICS):
+            value = stats
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            values[name] = value
+
+        timestamp = stats['timestamp']
+        for i, tier in enumerate(self.tiers):
+            start = timestamp - timestamp % tier.resolution
+            bucket = self.buckets[i]
+            if bucket is not None and bucket.start != start:
+                tier.append(*bucket.summary())
+                bucket = None
+            if bucket is None:
+                bucket = self.buckets[i] = RollupBucket(start, self.cores)
+            bucket.add(values, per_cpu)
+
+    def close(self):
+        for tier in self.tiers:
+            tier.close()
+
+# 持久化存储的段文件: 每小时一个文件, 文件头之后每个字段一列, 最后是每条记录的各核心占用率
+# 列与文件头均为小端序, 便于直接按数组读取
+STORE_MAGIC = b'SMTS'
+STORE_VERSION = 1
+STORE_HEADER = struct.Struct('<4sHIHId')
+STORE_COUNT = struct.Struct('<I')
+STORE_COUNT_OFFSET = struct.calcsize('<4sHIH')
+STORE_HEADER_SIZE = 64
+STORE_COLUMNS = tuple((path, struct.Struct('<' + code), code == 'Q') for path, code in STATS_FIELDS)
+SEGMENT_SECONDS = 3600
+
+def segment_layout(capacity, cores):
+    offsets = []
+    offset = STORE_HEADER_SIZE
+    for _, st, _ in STORE_COLUMNS:
+        offsets.append(offset)
+        offset += (capacity * st.size + 7) // 8 * 8
+    return offsets, offset, offset + capacity * cores * 2
+
+class StoreSegment:
+    """一个小时的定长列式段文件, 通过 mmap 追加写入"""
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.file = open(path, 'r+b' if writable else 'rb')
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.file.close()
+            raise
+        magic, version, self.capacity, self.cores, _, self.start = STORE_HEADER.unpack_from(self.mm, 0)
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            self.close()
+            raise ValueError(f"无法识别的段文件: {path}")
+        self.offsets, self.per_cpu_offset, size = segment_layout(self.capacity, self.cores)
+        if len(self.mm) < size:
+            self.close()
+            raise ValueError(f"段文件不完整: {path}")
+
+    @classmethod
+    def create(cls, path, start, capacity, cores):
+        _, _, size = segment_layout(capacity, cores)
+        with open(path, 'wb') as f:
+            f.write(STORE_HEADER.pack(STORE_MAGIC, STORE_VERSION, capacity, cores, 0, start))
+            f.truncate(size)
+        return cls(path, writable=True)
+
+    @property
+    def count(self):
+        return STORE_COUNT.unpack_from(self.mm, STORE_COUNT_OFFSET)[0]
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    def append(self, stats):
+        index = self.count
+        for (path, st, integer), offset in zip(STORE_COLUMNS, self.offsets):
+            value = stats
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            if value is None:
+                value = 0 if integer else float('nan')
+            st.pack_into(self.mm, offset + index * st.size, int(value) if integer else float(value))
+        if self.cores:
+            per_cpu = stats.get('cpu', {}).get('per_cpu') or []
+            packed = array('H', (quantize_usage(v) for v in per_cpu))
+            if sys.byteorder == 'big':
+                packed.byteswap()
+            start = self.per_cpu_offset + index * self.cores * 2
+            self.mm[start:start + self.cores * 2] = packed.tobytes()
+        # 数据写完后再更新记录数, 崩溃时最多丢失最后一条未计数的记录
+        STORE_COUNT.pack_into(self.mm, STORE_COUNT_OFFSET, index + 1)
+
+    def timestamps(self):
+        _, st, _ = STORE_COLUMNS[0]
+        values = array('d')
+        values.frombytes(self.mm[self.offsets[0]:self.offsets[0] + self.count * st.size])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+
+    def record(self, index):
+        stats = {}
+        for (path, st, integer), offset in zip(STORE_COLUMNS, self.offsets):
+            value, = st.unpack_from(self.mm, offset + index * st.size)
+            if value != value:
+                continue
+            if path in FLOAT_DIGITS:
+                value = round(value, FLOAT_DIGITS[path])
+            if len(path) == 1:
+                stats[path[0]] = value
+            else:
+                stats.setdefault(path[0], {})[path[1]] = value
+        if self.cores:
+            packed = array('H')
+            start = self.per_cpu_offset + index * self.cores * 2
+            packed.frombytes(self.mm[start:start + self.cores * 2])
+            if sys.byteorder == 'big':
+                packed.byteswap()
+            stats.setdefault('cpu', {})['per_cpu'] = [v / 100 for v in packed]
+        return stats
+
+    def records(self, start, end):
+        timestamps = self.timestamps()
+        for index in range(bisect.bisect_left(timestamps, start), bisect.bisect_right(timestamps, end)):
+            yield self.record(index)
+
+    def flush(self):
+        self.mm.flush()
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+class MetricStore:
+    """本机指标的持久化存储: 采样线程按固定间隔追加记录, 每隔 sync_interval 秒刷盘一次"""
+
+    def __init__(self, directory, interval=1, sync_interval=10, retention=None):
+        self.directory = directory
+        self.interval = interval
+        self.sync_interval = sync_interval
+        # 原始段文件保留的秒数, 更早的文件在换段时删除; 长期数据由聚合层级保存
+        self.retention = retention
+        # 采样可能略快于标称间隔, 段容量留出余量, 写满时换用下一个序号的文件
+        self.capacity = int(SEGMENT_SECONDS / interval * 1.1) + 1
+        self.ticks = None
+        self.segment = None
+        self.last_sync = time.monotonic()
+
+    def attach(self, sampler):
+        os.makedirs(self.directory, exist_ok=True)
+        self.ticks = sampler.ticks_for(self.interval)
+        sampler.reserve(self.ticks, STATS_GROUPS, True)
+        sampler.listeners.append(self.record)
+
+    def segment_path(self, start, sequence):
+        name = time.strftime('%Y%m%d-%H', time.gmtime(start))
+        if sequence:
+            name += f'.{sequence}'
+        return os.path.join(self.directory, name + '.seg')
+
+    def segments(self):
+        # 文件名为 UTC 小时加可选序号
+        for name in os.listdir(self.directory):
+            if not name.endswith('.seg'):
+                continue
+            try:
+                hour = calendar.timegm(time.strptime(name[:11], '%Y%m%d-%H'))
+                sequence = int(name[12:-4] or 0)
+            except ValueError:
+                continue
+            yield hour, sequence, name
+
+    def expire(self, start):
+        if not self.retention:
+            return
+        for hour, _, name in list(self.segments()):
+            if hour + SEGMENT_SECONDS <= start - self.retention:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError as e:
+                    print(f"删除过期段文件 {name} 时出错: {e}")
+
+    def open_segment(self, start, cores):
+        self.expire(start)
+        # 同一小时内重启时接着写已有文件, 核心数不同或已写满时换用下一个序号
+        sequence = 0
+        while True:
+            path = self.segment_path(start, sequence)
+            if not os.path.exists(path):
+                return StoreSegment.create(path, start, self.capacity, cores)
+            try:
+                segment = StoreSegment(path, writable=True)
+            except (OSError, ValueError) as e:
+                print(f"跳过无法打开的段文件 {path}: {e}")
+            else:
+                if segment.cores == cores and not segment.full:
+                    return segment
+                segment.close()
+            sequence += 1
+
+    def record(self, stats, windows):
+        if self.ticks not in windows:
+            return
+        try:
+            self.append(windows[self.ticks])
+        except (OSError, ValueError) as e:
+            print(f"写入持久化存储时出错: {e}")
+
+    def append(self, stats):
+        timestamp = stats['timestamp']
+        start = timestamp - timestamp % SEGMENT_SECONDS
+        cores = len(stats.get('cpu', {}).get('per_cpu') or [])
+        segment = self.segment
+        if segment is None or segment.start != start or segment.cores != cores or segment.full:
+            if segment is not None:
+                segment.flush()
+                segment.close()
+            self.segment = segment = self.open_segment(start, cores)
+        segment.append(stats)
+
+        now = time.monotonic()
+        if now - self.last_sync >= self.sync_interval:
+            segment.flush()
+            self.last_sync = now
+
+    def close(self):
+        if self.segment is not None:
+            self.segment.flush()
+            self.segment.close()
+            self.segment = None
+
+    def query(self, start, end):
+        """按时间顺序返回 [start, end] 范围内的记录"""
+        # 先按文件名中的小时筛选, 再在段内按时间戳二分查找
+        names = sorted(
+            (hour, sequence, name) for hour, sequence, name in self.segments()
+            if hour + SEGMENT_SECONDS >= start and hour <= end
+        )
+        for _, _, name in names:
+            try:
+                segment = StoreSegment(os.path.join(self.directory, name))
+            except (OSError, ValueError) as e:
+                print(f"跳过无法打开的段文件 {name}: {e}")
+                continue
+            try:
+                yield from segment.records(start, end)
+            finally:
+                segment.close()
+
+EXPORT_PREFIX = 'server_monitor_'
+EXPORT_METRICS = (
+    # (名称, 类型, 说明, 字段路径)
+    ('cpu_usage_percent', 'gauge', "CPU 总使用率", ('cpu', 'percent')),
+    ('cpu_frequency_mhz', 'gauge', "CPU 当前频率", ('cpu', 'freq')),
+    ('memory_used_bytes', 'gauge', "已用内存", ('memory', 'used')),
+    ('memory_total_bytes', 'gauge', "内存总量", ('memory', 'total')),
+    ('memory_usage_percent', 'gauge', "内存使用率", ('memory', 'percent')),
+    ('network_sent_bytes_total', 'counter', "累计发送字节数", ('network', 'bytes_sent')),
+    ('network_received_bytes_total', 'counter', "累计接收字节数", ('network', 'bytes_recv')),
+    ('network_upload_bytes_per_second', 'gauge', "上传速度", ('network', 'upload_speed')),
+    ('network_download_bytes_per_second', 'gauge', "下载速度", ('network', 'download_speed')),
+    ('last_sample_timestamp_seconds', 'gauge', "最近一次采样的时间", ('timestamp',)),
+)
+EXPORT_CORE_METRIC = ('cpu_core_usage_percent', 'gauge', "每个核心的使用率", ('cpu', 'per_cpu'))
+EXPORT_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def format_sample(value):
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_samples(source, stats):
+    """把一个数据源的最新样本转换为各指标的文本行"""
+    label = f'source="{escape_label(source)}"'
+    samples = {}
+    for name, _, _, path in EXPORT_METRICS:
+        value = stats
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if isinstance(value, (int, float)):
+            samples[name] = [f'{EXPORT_PREFIX}{name}{{{label}}} {format_sample(value)}\n']
+    per_cpu = stats.get('cpu', {}).get('per_cpu')
+    if per_cpu:
+        name = EXPORT_CORE_METRIC[0]
+        samples[name] = [
+            f'{EXPORT_PREFIX}{name}{{{label},core="{core}"}} {format_sample(value)}\n'
+            for core, value in enumerate(per_cpu)
+        ]
+    return samples
+
+class MetricsExporter:
+    """Prometheus 文本格式导出: 每个采样周期生成一次完整响应, 抓取时直接返回缓存的字节, 不额外采集"""
+
+    TIMEOUT = 10
+
+    def __init__(self, sources, interval=1):
+        self.body = b''
+        self.samples = {}
+        self.lock = threading.Lock()
+        for name, source in sources.items():
+            ticks = None
+            if isinstance(source, StatsSampler):
+                # 本机采样器按导出间隔固定采集全部分组; 中继模式下上游始终推送全部分组
+                ticks = source.ticks_for(interval)
+                source.reserve(ticks, STATS_GROUPS, True)
+            source.listeners.append(partial(self.record, name, ticks))
+
+    def record(self, source, ticks, stats, windows):
+        if ticks is not None:
+            if ticks not in windows:
+                return
+            stats = windows[ticks]
+        samples = render_samples(source, stats)
+        with self.lock:
+            self.samples[source] = samples
+            self.body = self.render()
+
+    def render(self):
+        lines = []
+        for name, kind, help_text, _ in EXPORT_METRICS + (EXPORT_CORE_METRIC,):
+            family = [line for samples in self.samples.values() for line in samples.get(name, ())]
+            if family:
+                lines.append(f'# HELP {EXPORT_PREFIX}{name} {help_text}\n# TYPE {EXPORT_PREFIX}{name} {kind}\n')
+                lines.extend(family)
+        return ''.join(lines).encode('utf-8')
+
+    async def handle_request(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.TIMEOUT)
+            method, path, _ = request.split(b'\r\n', 1)[0].decode('latin-1').split(' ', 2)
+            path = path.split('?', 1)[0]
+            if path != '/metrics':
+                status, body, content_type = '404 Not Found', b'Not Found\n', 'text/plain'
+            elif method not in ('GET', 'HEAD'):
+                status, body, content_type = '405 Method Not Allowed', b'Method Not Allowed\n', 'text/plain'
+            else:
+                status, body, content_type = '200 OK', self.body, EXPORT_CONTENT_TYPE
+            header = (
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n"
+            )
+            writer.write(header.encode('latin-1'))
+            if method != 'HEAD':
+                writer.write(body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_request, host, port)
+        print(f"指标导出已启动: http://{host}:{port}/metrics")
+        return server
+
+class StreamRecorder:
+    """把各数据源的样本按二进制增量格式追加到录制文件, 内容与订阅基础分组的客户端收到的相同, 客户端可直接回放"""
+
+    def __init__(self, path, sources, interval=1, keyframe_interval=30):
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(RECORD_MAGIC)
+        self.listeners = []
+        for index, (name, source) in enumerate(sources.items()):
+            ticks = None
+            if isinstance(source, StatsSampler):
+                ticks = source.ticks_for(interval)
+                source.reserve(ticks, STATS_GROUPS, True)
+            channel = Channel((name, 'binary', True, STATS_GROUPS, True, ticks), keyframe_interval)
+            self.write(RECORD_STREAM, index, name.encode('utf-8'))
+            self.write(RECORD_DATA, index, encode_message({
+                'type': 'hello',
+                'version': PROTOCOL_VERSION,
+                'format': 'binary',
+                'delta': True,
+                'groups': sorted(STATS_GROUPS),
+                'per_cpu': True,
+                'source': name
+            }))
+            listener = partial(self.record, index, channel)
+            source.listeners.append(listener)
+            self.listeners.append((source, listener))
+
+    def record(self, index, channel, stats, windows):
+        # 中继模式下每个上游样本都录制; 上游未推送每核心数据时以关键帧记录结构变化
+        if channel.ticks is not None:
+            if channel.ticks not in windows:
+                return
+            stats = windows[channel.ticks]
+        if not STATS_GROUPS.issubset(stats):
+            return
+        self.write(RECORD_DATA, index, channel.encode(stats))
+
+    def write(self, kind, index, data):
+        self.file.write(RECORD_HEADER.pack(kind, time.time(), index, len(data)) + data)
+        self.file.flush()
+
+    def close(self):
+        for source, listener in self.listeners:
+            source.listeners.remove(listener)
+        self.file.close()
+
+class ClientConnection:
+    def __init__(self, writer, source):
+        self.writer = writer
+        self.addr = writer.get_extra_info('peername')
+        self.source = source
+        self.dropped = 0
+        self.channel = None
+        self.resync = False
+        self.format = 'json'
+        self.delta = False
+        self.groups = STATS_GROUPS
+        self.per_cpu = True
+        self.ticks = 1
+        self.pending = None
+
+class MonitorServer:
+    MAX_DROPPED = 30
+    # 连接后这么多秒内没有收到握手的视为旧版客户端, 按默认订阅发送 JSON
+    HELLO_TIMEOUT = 1
+
+    def __init__(self, sources, high_water=256 * 1024, keyframe_interval=30):
+        # sources: 数据源名称 -> 本机采样器或中继模式下的上游服务端, 第一个为默认数据源
+        self.sources = sources
+        self.default_source = next(iter(sources))
+        self.high_water = high_water
+        self.keyframe_interval = keyframe_interval
+        self.channels = {}
+        self.loop = None
+        for name, source in sources.items():
+            source.listeners.append(partial(self.publish, name))
+
+    def publish(self, source, stats, windows):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.broadcast, source, windows)
+
+    def broadcast(self, source, windows):
+        # 只发送给本次到期的通道, 每个通道每个周期只序列化一次
+        for channel in list(self.channels.values()):
+            if channel.source != source or channel.ticks not in windows:
+                continue
+            stats = windows[channel.ticks]
+            if not channel.clients or not channel.covers(stats):
+                continue
+            payload = channel.encode(stats)
+            keyframe = None
+            for client in list(channel.clients):
+                if client.resync:
+                    if keyframe is None:
+                        keyframe = channel.keyframe()
+                    self.send(client, keyframe)
+                else:
+                    self.send(client, payload)
+
+    def join(self, client):
+        if client.pending is not None:
+            client.pending.cancel()
+            client.pending = None
+        key = (client.source, client.format, client.delta, client.groups, client.per_cpu, client.ticks)
+        if client.channel is not None:
+            if client.channel.key == key:
+                return
+            self.leave(client)
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = self.channels[key] = Channel(key, self.keyframe_interval)
+            self.update_source(channel.source)
+        channel.clients.add(client)
+        client.channel = channel
+        # 不立即补发通道当前的样本 (客户端会把它当作新样本重复记录), 在通道下一次到期时
+        # 增量模式的客户端先收到一个关键帧, 之后与通道内其他客户端共用增量
+        client.resync = client.delta
+
+    def leave(self, client):
+        channel = client.channel
+        if channel is None:
+            return
+        channel.clients.discard(client)
+        if not channel.clients:
+            del self.channels[channel.key]
+            self.update_source(channel.source)
+        client.channel = None
+
+    def update_source(self, source):
+        # 按采样间隔合并各通道, 数据源在每个间隔上只采集需要的分组
+        rates = {}
+        for channel in self.channels.values():
+            if channel.source != source:
+                continue
+            groups, per_cpu = rates.get(channel.ticks, (frozenset(), False))
+            rates[channel.ticks] = (
+                groups | channel.groups,
+                per_cpu or (channel.per_cpu and 'cpu' in channel.groups)
+            )
+        self.sources[source].set_rates(rates)
+
+    def send(self, client, payload):
+        transport = client.writer.transport
+        if transport.is_closing():
+            return
+        # 客户端读取过慢时丢弃本次数据而不是无限缓存, 长时间无法写出则断开
+        # 丢帧后增量基准失效, 下次可写时补发关键帧
+        if transport.get_write_buffer_size() > self.high_water:
+            client.dropped += 1
+            client.resync = client.channel.delta
+            if client.dropped > self.MAX_DROPPED:
+                print(f"客户端 {client.addr} 长时间未读取数据, 断开连接")
+                transport.abort()
+            return
+        client.dropped = 0
+        client.resync = False
+        client.writer.write(payload)
+
+    async def handle_client(self, reader, writer):
+        client = ClientConnection(writer, self.default_source)
+        source = self.sources[client.source]
+        client.ticks = source.ticks_for(source.interval)
+        print(f"新的连接来自: {client.addr}")
+        writer.transport.set_write_buffer_limits(high=self.high_water)
+        # 新版客户端连接后立即发送握手, 按握手中的格式和订阅加入通道, 之前不发送任何数据
+        client.pending = asyncio.get_running_loop().call_later(self.HELLO_TIMEOUT, self.join, client)
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line.decode('utf-8'))
+                except ValueError as e:
+                    print(f"客户端 {client.addr} 发送了无效消息: {e}")
+                    continue
+                if isinstance(message, dict):
+                    self.handle_message(client, message)
+        except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError) as e:
+            print(f"客户端 {client.addr} 断开连接: {e}")
+        except Exception as e:
+            print(f"处理客户端 {client.addr} 时发生错误: {e}")
+        finally:
+            if client.pending is not None:
+                client.pending.cancel()
+            self.leave(client)
+            writer.close()
+            print(f"与 {client.addr} 的连接已关闭")
+
+    def handle_message(self, client, message):
+        if message.get('type') == 'hello':
+            version = min(int(message.get('version', 1)), PROTOCOL_VERSION)
+            fmt = message.get('format', 'json')
+            if version < 2 or fmt not in ENCODERS:
+                fmt = 'json'
+            client.format = fmt
+            client.delta = version >= 2 and bool(message.get('delta', False))
+            self.set_subscription(client, message)
+            source = self.sources[client.source]
+            reply = {
+                'type': 'hello',
+                'version': version,
+                'format': client.format,
+                'delta': client.delta,
+                'groups': sorted(client.groups),
+                'per_cpu': client.per_cpu,
+                'interval': round(client.ticks * source.min_interval, 6),
+                'source': client.source,
+                'sources': list(self.sources)
+            }
+            # 中继模式下可以随握手应答一起取回最近的历史数据
+            history = getattr(source, 'history', None)
+            if history is not None and message.get('history'):
+                try:
+                    count = max(int(message['history']), 0)
+                except (TypeError, ValueError):
+                    count = 0
+                samples = list(history)[-count:] if count else []
+                reply['history'] = [select_stats(stats, client.groups, client.per_cpu) for stats in samples]
+            client.writer.write(encode_message(reply))
+            self.join(client)
+        elif message.get('type') == 'subscribe':
+            self.set_subscription(client, message)
+            self.join(client)
+        elif message.get('type') == 'query':
+            client.writer.write(encode_reply(client.format, self.query(client, message)))
+
+    def query(self, client, message):
+        """查询一段时间的指标, 按目标点数在服务端降采样; 时间范围较长时使用聚合层级"""
+        reply = {'type': 'reply', 'id': message.get('id')}
+        source = self.sources[client.source]
+        tables = [source.metrics] if source.metrics is not None else []
+        if source.rollup is not None:
+            tables += source.rollup.tiers
+        if not tables:
+            reply['error'] = "服务端未保留历史数据"
+            return reply
+        names = message.get('metric')
+        if isinstance(names, str):
+            names = [names]
+        if isinstance(names, list) and names and all(isinstance(name, str) for name in names):
+            tables = [table for table in tables if table.supports(names)]
+        else:
+            tables = []
+        if not tables:
+            reply['error'] = f"未知的指标: {names}"
+            return reply
+        method = message.get('method', 'minmax')
+        if method not in ('minmax', 'lttb'):
+            reply['error'] = f"未知的降采样方式: {method}"
+            return reply
+        try:
+            points = min(max(int(message.get('points', 300)), 3), MAX_QUERY_POINTS)
+            end = float(message['end']) if 'end' in message else time.time()
+            start = float(message['start']) if 'start' in message else end - float(message.get('seconds', 3600))
+        except (TypeError, ValueError):
+            reply['error'] = "无效的查询参数"
+            return reply
+
+        table = choose_table(tables, start, (end - start) / points)
+        timestamps, columns = table.select(names, start, end)
+        if np is not None:
+            timestamps = np.frombuffer(timestamps)
+            columns = {
+                name: {stat: np.frombuffer(values) for stat, values in stats.items()}
+                for name, stats in columns.items()
+            }
+        reply.update(metric=names, method=method, start=start, end=end, count=len(timestamps),
+                     tier=table.label, resolution=table.resolution)
+        if not len(timestamps):
+            reply['series'] = {}
+        elif method == 'lttb':
+            reply['series'] = downsample_lttb(timestamps, columns, points)
+        else:
+            reply['timestamp'], reply['series'] = downsample_minmax(timestamps, columns, points)
+        return reply
+
+    def set_subscription(self, client, message):
+        source = message.get('source')
+        if source in self.sources:
+            client.source = source
+        groups = message.get('groups')
+        if isinstance(groups, list):
+            client.groups = ALL_GROUPS.intersection(groups)
+        client.per_cpu = bool(message.get('per_cpu', client.per_cpu))
+        try:
+            if 'interval' in message:
+                client.ticks = self.sources[client.source].ticks_for(message['interval'])
+        except (TypeError, ValueError):
+            pass
+
+    async def serve(self, host, port, backlog, exporter=None, metrics_port=None):
+        self.loop = asyncio.get_running_loop()
+        if exporter is not None:
+            await exporter.serve(host, metrics_port)
+        upstreams = [
+            asyncio.ensure_future(source.follow())
+            for source in self.sources.values() if isinstance(source, UpstreamSource)
+        ]
+        if upstreams:
+            print(f"中继模式, 上游服务端: {', '.join(self.sources)}")
+        server = await asyncio.start_server(
+            self.handle_client,
+            host,
+            port,
+            backlog=backlog
+        )
+        print(f"服务器启动，监听 {host}:{port}")
+        print("made by EXE_autumnwind 版本:2.0[Linux优化版]")
+        async with server:
+            await server.serve_forever()
+
+def parse_hosts(text, default_port=5021):
+    # "host1:5021, host2" -> [('host1', 5021), ('host2', 5021)]
+    hosts = []
+    for item in text.replace(',', ' ').split():
+        host, _, port = item.rpartition(':')
+        if host and port.isdigit():
+            hosts.append((host.strip('[]'), int(port)))
+        else:
+            hosts.append((item, default_port))
+    return hosts
+
+def parse_time(text):
+    # 时间戳或本地时间, 如 2026-10-17T03:12
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+def dump_store(directory, start, end):
+    for stats in MetricStore(directory).query(start, end):
+        print(json.dumps(stats))
+
+def start_server(host='0.0.0.0', port=5021, backlog=1024, high_water=256 * 1024,
+                 keyframe_interval=30, interval=1, min_interval=0.1, relay=None, history=600,
+                 store=None, store_interval=1, sync_interval=10, retain=3600, retain_interval=1,
+                 tiers=(), store_retention=None, metrics_port=None, top=10, disk_usage_interval=30,
+                 collector=DEFAULT_COLLECTOR, collector_options=None, record=None, record_interval=1):
+    metric_store = None
+    rollup = None
+    if relay:
+        # 中继模式: 不采集本机数据, 每台上游服务端只建立一个连接, 转发给所有下游客户端
+        sources = {}
+        for upstream_host, upstream_port in relay:
+            source = UpstreamSource(upstream_host, upstream_port, interval, min_interval, history)
+            sources[source.name] = source
+    else:
+        sampler = StatsSampler(interval, min_interval, top, disk_usage_interval)
+        sampler.collect = create_collector(collector, collector_options)
+        if retain > 0:
+            sampler.metrics = MetricHistory(max(1, int(retain / retain_interval)))
+            sampler.metrics.attach(sampler, retain_interval)
+        if tiers:
+            # 有持久化目录时层级文件放在同一目录, 否则只保存在内存中
+            sampler.rollup = rollup = Rollup(tiers, store, retain_interval)
+            rollup.attach(sampler)
+        if store:
+            metric_store = MetricStore(store, store_interval, sync_interval, store_retention)
+            metric_store.attach(sampler)
+        sampler.start()
+        sources = {'local': sampler}
+    server = MonitorServer(sources, high_water=high_water, keyframe_interval=keyframe_interval)
+    exporter = MetricsExporter(sources, interval) if metrics_port else None
+    recorder = StreamRecorder(record, sources, record_interval, keyframe_interval) if record else None
+    try:
+        asyncio.run(server.serve(host, port, backlog, exporter, metrics_port))
+    except KeyboardInterrupt:
+        print("服务器已停止")
+    finally:
+        if metric_store is not None:
+            sampler.listeners.remove(metric_store.record)
+            metric_store.close()
+        if rollup is not None:
+            sampler.listeners.remove(rollup.record)
+            rollup.close()
+        if recorder is not None:
+            recorder.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="服务器性能监控服务端")
+    parser.add_argument('--host', default='0.0.0.0', help="监听地址")
+    parser.add_argument('--port', type=int, default=5021, help="监听端口")
+    parser.add_argument('--backlog', type=int, default=1024, help="等待接受的连接队列长度")
+    parser.add_argument('--high-water', type=int, default=256 * 1024,
+                        help="单个客户端写缓冲上限 (字节), 超过后丢弃该客户端的数据")
+    parser.add_argument('--keyframe-interval', type=int, default=30,
+                        help="增量模式下每隔多少帧发送一次完整关键帧")
+    parser.add_argument('--interval', type=float, default=1,
+                        help="未指定采样间隔的客户端使用的默认间隔 (秒)")
+    parser.add_argument('--min-interval', type=float, default=0.1,
+                        help="允许客户端请求的最小采样间隔 (秒)")
+    parser.add_argument('--relay', type=parse_hosts, default=None, metavar='HOSTS',
+                        help="中继模式: 订阅这些上游服务端 (host:port, 逗号分隔) 并转发给下游客户端")
+    parser.add_argument('--history', type=int, default=600,
+                        help="中继模式下每台上游服务端保留的历史样本数")
+    parser.add_argument('--retain', type=float, default=3600,
+                        help="内存中保留多少秒的本机历史供范围查询, 0 表示不保留; "
+                             "保留时即使没有客户端也按 --retain-interval 采集 cpu/memory/network (不含每核心数据)")
+    parser.add_argument('--retain-interval', type=float, default=1,
+                        help="内存历史的采样间隔 (秒)")
+    parser.add_argument('--store', default=None, metavar='DIR',
+                        help="将本机指标持久化到该目录 (每小时一个段文件), 启用后按 --store-interval 持续采集基础分组和每核心数据")
+    parser.add_argument('--store-interval', type=float, default=1,
+                        help="持久化存储的采样间隔 (秒)")
+    parser.add_argument('--sync-interval', type=float, default=10,
+                        help="持久化存储每隔多少秒刷盘一次")
+    parser.add_argument('--store-retention', type=parse_duration, default=parse_duration('2d'),
+                        help="原始段文件保留多久 (如 48h, 2d), 0 表示不删除")
+    parser.add_argument('--tiers', type=parse_tiers, default=(),
+                        help="聚合层级, 格式为 分辨率:保留期限, 逗号分隔, 如 10s:1d,1m:7d,1h:90d; 默认不聚合. "
+                             "启用后即使没有客户端也按 --retain-interval 采集 cpu/memory/network 和每核心数据")
+    parser.add_argument('--metrics-port', type=int, default=None, metavar='PORT',
+                        help="在该端口提供 Prometheus 格式的 /metrics 接口")
+    parser.add_argument('--top', type=int, default=10,
+                        help="进程列表按 CPU 和内存各发送前多少个进程")
+    parser.add_argument('--disk-usage-interval', type=float, default=30,
+                        help="挂载点用量的采集间隔 (秒)")
+    parser.add_argument('--collector', choices=sorted(COLLECTORS), default=DEFAULT_COLLECTOR,
+                        help="本机指标的采集后端, synthetic 为合成数据 (用于基准测试)")
+    parser.add_argument('--synthetic', type=parse_options, default={}, metavar='OPTIONS',
+                        help="合成数据源的参数, 如 cores=256,nics=8,wave=square,period=10,rate=1e8,seed=1")
+    parser.add_argument('--no-proc', dest='collector', action='store_const', const='psutil',
+                        help="不使用 /proc 快速采集, 改用 psutil (同 --collector psutil)")
+    parser.add_argument('--record', default=None, metavar='FILE',
+                        help="把本机 (中继模式下为各上游) 的样本追加录制到该文件, 可用客户端 --replay 回放")
+    parser.add_argument('--record-interval', type=float, default=1,
+                        help="录制的采样间隔 (秒), 中继模式下录制上游推送的每个样本")
+    parser.add_argument('--dump', nargs=2, type=parse_time, default=None, metavar=('START', 'END'),
+                        help="输出 --store 目录中该时间范围内的记录 (JSON 行) 后退出")
+    args = parser.parse_args()
+    if args.dump and not args.store:
+        parser.error("--dump 需要同时指定 --store")
+    if args.dump and not os.path.isdir(args.store):
+        parser.error(f"--store 目录不存在: {args.store}")
+    if args.synthetic and args.collector != 'synthetic':
+        parser.error("--synthetic 需要同时指定 --collector synthetic")
+    if args.collector == 'synthetic':
+        try:
+            SyntheticCollector(**args.synthetic)
+        except (TypeError, ValueError) as e:
+            parser.error(f"--synthetic 参数无效: {e}")
+    return args
 
 if __name__ == "__main__":
-    start_server()
+    args = parse_args()
+    if args.dump:
+        dump_store(args.store, *args.dump)
+    else:
+        start_server(args.host, args.port, args.backlog, args.high_water, args.keyframe_interval,
+                     args.interval, args.min_interval, args.relay, args.history,
+                     args.store, args.store_interval, args.sync_interval,
+                     args.retain, args.retain_interval, args.tiers, args.store_retention,
+                     args.metrics_port, args.top, args.disk_usage_interval,
+                     args.collector, args.synthetic,
+                     args.record, args.record_interval)